@@ -0,0 +1,94 @@
+"""Messages per second of the notification fan-out against a fake Bot API
+
+    python -m benchmarks.notify_fanout --messages 500 --latency 0.05
+
+The fake server answers sendMessage after the given latency, like the real API
+does over the network. The rate limit of Telegram is off, so the numbers show what
+the concurrency alone gives.
+"""
+import argparse
+import asyncio
+import time
+
+from aiohttp import web
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from source.bot.notifications.fanout import Message, fan_out
+from source.parsers.http import TokenBucket
+
+HOST = "127.0.0.1"
+PORT = 8089
+TOKEN = "123:fake"
+
+
+def fake_api(latency: float) -> web.Application:
+    async def handle(request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if method == "getMe":
+            result = {
+                "id": 123,
+                "is_bot": True,
+                "first_name": "Fake",
+                "username": "fake_bot",
+            }
+        else:
+            data = await request.post()
+            await asyncio.sleep(latency)
+            result = {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": int(data["chat_id"]), "type": "private"},
+                "text": data["text"],
+            }
+        return web.json_response({"ok": True, "result": result})
+
+    app = web.Application()
+    app.router.add_post(f"/bot{TOKEN}/{{method}}", handle)
+    return app
+
+
+async def run(messages: int, latency: float, levels: list[int]) -> None:
+    runner = web.AppRunner(fake_api(latency))
+    await runner.setup()
+    await web.TCPSite(runner, HOST, PORT).start()
+
+    # The pool size of the bot built by ApplicationBuilder, a bare Bot has 1
+    bot = Bot(
+        token=TOKEN,
+        base_url=f"http://{HOST}:{PORT}/bot",
+        request=HTTPXRequest(connection_pool_size=256),
+    )
+    await bot.initialize()
+    try:
+        batch = [Message(chat_id, "Price changed", []) for chat_id in range(messages)]
+        for concurrency in levels:
+            limiter = TokenBucket(rate=1_000_000, burst=1_000_000)
+            started = time.perf_counter()
+            outcomes = await fan_out(
+                bot=bot, messages=batch, concurrency=concurrency, limiter=limiter
+            )
+            elapsed = time.perf_counter() - started
+            errors = sum(outcome.error is not None for outcome in outcomes)
+            print(
+                f"concurrency={concurrency:>3}: {messages / elapsed:8.1f} messages/s "
+                f"(errors={errors})"
+            )
+    finally:
+        await bot.shutdown()
+        await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05)  # seconds
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    args = parser.parse_args()
+
+    print(f"{args.messages} messages, {args.latency * 1000:.0f}ms per request")
+    asyncio.run(run(args.messages, args.latency, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Pages per second of each parser backend on stored product pages
+
+    python -m benchmarks.parser_backends path/to/pages --repeat 20
+
+Save onliner.by product pages as *.html files into the directory.
+A synthetic page of a similar size is used if no directory is passed.
+"""
+import argparse
+import time
+from pathlib import Path
+
+from source.parsers import onliner
+
+
+def synthetic_page() -> str:
+    filler = "".join(
+        f'<div class="offers-list__item"><a href="/p/{i}">Offer {i}</a><span>{i},00 р.</span></div>'
+        for i in range(3000)
+    )
+    return (
+        "<html><head><title>Product</title></head><body><header>menu</header>"
+        f'<h1 class="{onliner.NAME_CLASS}">Смартфон Example 128GB</h1>'
+        f'<a class="{onliner.PRICE_CLASS}" href="#">1 234,56 р.</a>'
+        f"{filler}</body></html>"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("directory", nargs="?", type=Path)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.directory:
+        pages = [
+            path.read_text(encoding="utf-8") for path in args.directory.glob("*.html")
+        ]
+    else:
+        pages = [synthetic_page()]
+    size = sum(len(page) for page in pages) / len(pages) / 1024
+    print(f"{len(pages)} pages, {size:.0f} KiB on average, {args.repeat} rounds")
+
+    expected = [onliner.extract_soup(page) for page in pages]
+    for name, backend in onliner.BACKENDS.items():
+        if name == "lxml" and onliner.lxml_html is None:
+            print(f"{name:>9}: lxml isn't installed")
+            continue
+
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            results = [backend(page) for page in pages]
+        elapsed = time.perf_counter() - started
+
+        # None means the fallback to the full parser
+        mismatches = sum(
+            result is not None and result != reference
+            for result, reference in zip(results, expected)
+        )
+        fallbacks = results.count(None)
+        print(
+            f"{name:>9}: {len(pages) * args.repeat / elapsed:8.1f} pages/s "
+            f"(mismatches={mismatches}, fallbacks={fallbacks})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Read latency during a concurrent refresh cycle with and without the SQLite profile
+
+    python -m benchmarks.sqlite_profile --products 2000 --readers 4
+
+The refresh cycle commits product by product through the application engine, as
+the refresh job did. Readers are threads with connections of their own, like other
+processes reading the file (the admin dashboard, a second bot instance), so they
+really contend with the writer for the database locks. In the rollback journal a
+commit waits for readers and readers wait for the commit, in WAL they don't.
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import make_url, select, update
+from sqlalchemy.dialects.sqlite import dialect as sqlite_dialect
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from source.database.engine import get_engine_options, set_sqlite_pragmas
+from source.database.models import Base, Product, User
+from source.database.settings import SQLITE_PRAGMAS
+
+
+async def prepare(session_maker: async_sessionmaker, products: int) -> None:
+    async with session_maker() as session:
+        user = User(username="reader", chat_id=1)
+        session.add(user)
+        for index in range(products):
+            product = Product(
+                product_link=f"https://catalog.onliner.by/product/{index}",
+                name=f"Product {index}",
+                current_price=100.0,
+                previous_price=100.0,
+                updated_at=datetime.now(),
+            )
+            product.users.append(user)
+            session.add(product)
+        await session.commit()
+
+
+async def refresh_cycle(session_maker: async_sessionmaker, products: int) -> None:
+    """One commit per product as the refresh job does it"""
+
+    for product_id in range(1, products + 1):
+        async with session_maker() as session:
+            query = (
+                update(Product)
+                .where(Product.id == product_id)
+                .values(
+                    previous_price=Product.current_price,
+                    current_price=Product.current_price + 1,
+                )
+            )
+            await session.execute(query)
+            await session.commit()
+
+
+def reader(
+    path: str, pragmas: dict, done: threading.Event, latencies: list, errors: list
+) -> None:
+    """The query of the product list menu on a connection of its own"""
+
+    query = str(
+        select(Product)
+        .where(Product.users.any(User.username == "reader"))
+        .limit(50)
+        .compile(dialect=sqlite_dialect(), compile_kwargs={"literal_binds": True})
+    )
+    connection = sqlite3.connect(path)
+    for name, value in pragmas.items():
+        connection.execute(f"PRAGMA {name}={value}")
+    try:
+        while not done.is_set():
+            started = time.perf_counter()
+            try:
+                connection.execute(query).fetchall()
+            except sqlite3.OperationalError:  # database is locked
+                errors.append(time.perf_counter() - started)
+                continue
+            latencies.append(time.perf_counter() - started)
+    finally:
+        connection.close()
+
+
+async def run(products: int, readers: int, with_profile: bool) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        url = make_url(f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}")
+        engine = create_async_engine(url, **get_engine_options(url))
+        if with_profile:
+            set_sqlite_pragmas(engine)
+        session_maker = async_sessionmaker(engine, expire_on_commit=False)
+
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await prepare(session_maker, products)
+
+        pragmas = {name: value for name, value in SQLITE_PRAGMAS.items() if value}
+        if not with_profile:
+            # The defaults of sqlite3, the busy timeout is the one of aiosqlite
+            pragmas = {"busy_timeout": 5000}
+
+        done = threading.Event()
+        latencies = []
+        errors = []
+        threads = [
+            threading.Thread(
+                target=reader,
+                args=(url.database, pragmas, done, latencies, errors),
+            )
+            for _ in range(readers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        started = time.perf_counter()
+        await refresh_cycle(session_maker, products)
+        cycle_time = time.perf_counter() - started
+        done.set()
+        for thread in threads:
+            thread.join()
+        await engine.dispose()
+
+    latencies = sorted(latency * 1000 for latency in latencies)
+    title = "with profile" if with_profile else "without profile"
+    print(
+        f"{title:>16}: cycle={cycle_time:.2f}s reads={len(latencies)} "
+        f"locked={len(errors)} "
+        f"p50={statistics.median(latencies):.2f}ms "
+        f"p95={latencies[int(len(latencies) * 0.95)]:.2f}ms "
+        f"p99={latencies[int(len(latencies) * 0.99)]:.2f}ms "
+        f"max={latencies[-1]:.2f}ms"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args()
+
+    await run(args.products, args.readers, with_profile=False)
+    await run(args.products, args.readers, with_profile=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
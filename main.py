@@ -1,11 +1,19 @@
 import asyncio
+import time
 
 import uvicorn
 from telegram.ext import ApplicationBuilder, ContextTypes
 
 from source.bot.all_handlers import handlers
+from source.bot.config.settings import DISPATCH_INTERVAL, ROLLING_JITTER, ROLLING_SLOTS, SCHEDULE_MODE, SCHEDULER_TICK
 from source.bot.config.tools.custom_entities import CustomContext
-from source.bot.config.tools.jobs import send_notifications
+from source.bot.config.tools.jobs import refresh_scheduled, refresh_slot, send_notifications
+from source.bot.config.tools.monitoring import loop_lag
+from source.bot.config.tools.scheduler import get_slot_delay
+from source.bot.notifications.dispatcher import dispatch_notifications, purge_notifications
+from source.database.engine import dispose_engine, init_engine, migrate
+from source.parsers.executor import init_executor, shutdown_executor
+from source.parsers.http import close_client, init_client
 from source.settings import HOST, PORT, SEND_DELAY, TOKEN, WEBHOOK_URL, get_logger
 from source.webserver.app import create_app
 
@@ -13,6 +21,17 @@ from source.webserver.app import create_app
 async def main():
     get_logger()
 
+    # Database: migrate then serve
+    init_engine()
+    await migrate()
+
+    # HTTP client for product pages
+    init_client()
+
+    # Pool for parsing product pages out of the event loop
+    init_executor()
+    loop_lag.start()
+
     context_types = ContextTypes(context=CustomContext)
 
     # App
@@ -23,7 +42,23 @@ async def main():
 
     # Jobs
     job_queue = application.job_queue
-    job_queue.run_repeating(send_notifications, interval=SEND_DELAY, first=1)
+    if SCHEDULE_MODE == "adaptive":
+        job_queue.run_repeating(refresh_scheduled, interval=SCHEDULER_TICK, first=1)
+    elif SCHEDULE_MODE == "rolling":
+        # Ticks start with slots, the jitter must not move a tick to the next slot
+        slot_duration = SEND_DELAY / ROLLING_SLOTS
+        job_queue.run_repeating(
+            refresh_slot,
+            interval=slot_duration,
+            first=get_slot_delay(time.time()),
+            job_kwargs={"jitter": min(ROLLING_JITTER, slot_duration / 2)},
+        )
+    else:
+        job_queue.run_repeating(send_notifications, interval=SEND_DELAY, first=1)
+    job_queue.run_repeating(
+        dispatch_notifications, interval=DISPATCH_INTERVAL, first=DISPATCH_INTERVAL
+    )
+    job_queue.run_repeating(purge_notifications, interval=86400, first=60)
 
     await application.bot.set_webhook(url=f"{WEBHOOK_URL}/telegram")
 
@@ -34,10 +69,16 @@ async def main():
     )
 
     # Run application and webserver together
-    async with application:
-        await application.start()
-        await webserver.serve()
-        await application.stop()
+    try:
+        async with application:
+            await application.start()
+            await webserver.serve()
+            await application.stop()
+    finally:
+        loop_lag.stop()
+        shutdown_executor()
+        await close_client()
+        await dispose_engine()
 
 
 if __name__ == "__main__":
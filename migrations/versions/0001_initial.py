@@ -0,0 +1,74 @@
+"""Initial tables
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(), nullable=True),
+        sa.Column("chat_id", sa.Integer(), nullable=True),
+        sa.Column("is_admin", sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("chat_id"),
+        sa.UniqueConstraint("username"),
+    )
+    op.create_table(
+        "products",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("product_link", sa.String(), nullable=False),
+        sa.Column("name", sa.String(), nullable=True),
+        sa.Column("current_price", sa.Float(), nullable=False),
+        sa.Column("previous_price", sa.Float(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("product_link"),
+    )
+    op.create_table(
+        "unregistered_users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(), nullable=True),
+        sa.Column("chat_id", sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("chat_id"),
+        sa.UniqueConstraint("username"),
+    )
+    op.create_table(
+        "session_tokens",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("token", sa.String(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("token"),
+    )
+    op.create_table(
+        "users_products",
+        sa.Column("users_id", sa.Integer(), nullable=False),
+        sa.Column("products_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["products_id"], ["products.id"]),
+        sa.ForeignKeyConstraint(["users_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("users_id", "products_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("users_products")
+    op.drop_table("session_tokens")
+    op.drop_table("unregistered_users")
+    op.drop_table("products")
+    op.drop_table("users")
@@ -0,0 +1,40 @@
+"""Store chat IDs as 64-bit integers
+
+Telegram chat IDs don't fit into the 32-bit INTEGER of PostgreSQL
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for table in ("users", "unregistered_users"):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                "chat_id",
+                existing_type=sa.Integer(),
+                type_=sa.BigInteger(),
+                existing_nullable=True,
+            )
+
+
+def downgrade() -> None:
+    for table in ("users", "unregistered_users"):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                "chat_id",
+                existing_type=sa.BigInteger(),
+                type_=sa.Integer(),
+                existing_nullable=True,
+            )
@@ -0,0 +1,42 @@
+"""Price history
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "price_points",
+        sa.Column("product_id", sa.Integer(), nullable=False),
+        sa.Column("ts", sa.DateTime(), nullable=False),
+        sa.Column("price", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["product_id"], ["products.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("product_id", "ts"),
+        sqlite_with_rowid=False,
+    )
+    # Seed the history with the prices known so far
+    op.get_bind().execute(
+        sa.text(
+            "INSERT INTO price_points (product_id, ts, price) "
+            "SELECT id, :ts, current_price FROM products"
+        ).bindparams(sa.bindparam("ts", type_=sa.DateTime())),
+        {"ts": datetime.now()},
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("price_points")
@@ -0,0 +1,30 @@
+"""Validators and fingerprints of product pages
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("products") as batch_op:
+        batch_op.add_column(sa.Column("etag", sa.String(), nullable=True))
+        batch_op.add_column(sa.Column("last_modified", sa.String(), nullable=True))
+        batch_op.add_column(sa.Column("fingerprint", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("products") as batch_op:
+        batch_op.drop_column("fingerprint")
+        batch_op.drop_column("last_modified")
+        batch_op.drop_column("etag")
@@ -0,0 +1,90 @@
+"""Canonical product links
+
+Products with the same link up to the case of the host, the query, the fragment and
+the trailing slash are merged into one, with their subscribers and price history
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def canonicalize_link(link: str) -> str:
+    """A copy of `source.bot.products.services.canonicalize_link` at this revision"""
+
+    parts = urlsplit(link.strip())
+    return urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), "", "")
+    )
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.text(
+            "SELECT id, product_link, updated_at FROM products ORDER BY id"
+        ).columns(updated_at=sa.DateTime())
+    ).all()
+
+    groups: dict[str, list] = {}
+    for row in rows:
+        groups.setdefault(canonicalize_link(row.product_link), []).append(row)
+
+    for link, products in groups.items():
+        # Keep the product refreshed last, its price is the most recent
+        products.sort(key=lambda row: (row.updated_at or datetime.min, -row.id))
+        keeper, duplicates = products[-1], products[:-1]
+
+        for duplicate in duplicates:
+            params = {"keeper": keeper.id, "duplicate": duplicate.id}
+            connection.execute(
+                sa.text(
+                    "INSERT INTO users_products (users_id, products_id) "
+                    "SELECT users_id, :keeper FROM users_products "
+                    "WHERE products_id = :duplicate AND users_id NOT IN "
+                    "(SELECT users_id FROM users_products WHERE products_id = :keeper)"
+                ),
+                params,
+            )
+            connection.execute(
+                sa.text(
+                    "INSERT INTO price_points (product_id, ts, price) "
+                    "SELECT :keeper, ts, price FROM price_points "
+                    "WHERE product_id = :duplicate AND ts NOT IN "
+                    "(SELECT ts FROM price_points WHERE product_id = :keeper)"
+                ),
+                params,
+            )
+            for table, column in (
+                ("users_products", "products_id"),
+                ("price_points", "product_id"),
+                ("products", "id"),
+            ):
+                connection.execute(
+                    sa.text(f"DELETE FROM {table} WHERE {column} = :duplicate"),
+                    params,
+                )
+
+        if keeper.product_link != link:
+            connection.execute(
+                sa.text("UPDATE products SET product_link = :link WHERE id = :id"),
+                {"link": link, "id": keeper.id},
+            )
+
+
+def downgrade() -> None:
+    # Merged products can't be split back
+    pass
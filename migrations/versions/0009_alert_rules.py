@@ -0,0 +1,48 @@
+"""Alert rules of subscriptions
+
+Existing subscriptions keep the old rule: a change of the price by 1 BYN
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("users_products") as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                "alert_abs_delta",
+                sa.Float(),
+                server_default=sa.text("1"),
+                nullable=True,
+            )
+        )
+        batch_op.add_column(sa.Column("alert_pct_delta", sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column("target_price", sa.Float(), nullable=True))
+        batch_op.add_column(
+            sa.Column(
+                "notify_in_stock",
+                sa.Boolean(),
+                server_default=sa.false(),
+                nullable=False,
+            )
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("users_products") as batch_op:
+        batch_op.drop_column("notify_in_stock")
+        batch_op.drop_column("target_price")
+        batch_op.drop_column("alert_pct_delta")
+        batch_op.drop_column("alert_abs_delta")
@@ -5,25 +5,24 @@ from telegram.ext import ContextTypes
 
 from source.bot.admin.callback_data import *
 from source.bot.admin.queries import admin_exists, delete_user, insert_admin_or_update
-from source.bot.config.tools.decorators import log
+from source.bot.config.tools.decorators import log, with_session
 from source.bot.users.queries import select_users
-from source.database.engine import create_session
+from source.database.engine import checkpoint, reset_connections
 from source.settings import get_logger
 
 logger = get_logger(__name__)
 
 
 @log(logger)
+@with_session
 async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Run the admin menu"""
 
     keyboard = []
 
-    async_session = await create_session()
-    async with async_session() as session:
-        result = await admin_exists(
-            session=session, username=update.effective_user.username
-        )
+    result = await admin_exists(
+        session=context.session, username=update.effective_user.username
+    )
     if result:  # If admin exists
         context.user_data["is_admin"] = True
         keyboard.extend(
@@ -118,6 +117,7 @@ async def create_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 
 
 @log(logger)
+@with_session
 async def check_admin_key(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Checking the administrator key received from a text message"""
 
@@ -125,13 +125,11 @@ async def check_admin_key(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await update.message.delete()
 
     if admin_key == os.environ.get("ADMIN_KEY"):
-        async_session = await create_session()
-        async with async_session() as session:
-            username = update.effective_user.username
-            chat_id = update.effective_message.chat_id
-            admin_is_created = await insert_admin_or_update(
-                session=session, username=username, chat_id=chat_id
-            )
+        username = update.effective_user.username
+        chat_id = update.effective_message.chat_id
+        admin_is_created = await insert_admin_or_update(
+            session=context.session, username=username, chat_id=chat_id
+        )
 
         if admin_is_created:
             extra_text = "\U0001F44D Вы добавлены как администратор"
@@ -157,12 +155,13 @@ async def admin_back(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 
 @log(logger)
+@with_session
 async def user_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Displaying all users"""
 
     await update.callback_query.answer()
 
-    users = await select_users(is_admin=False)
+    users = await select_users(session=context.session, is_admin=False)
     if users:
         context.user_data["users"] = {
             f"user_id={callback_index}": user
@@ -220,15 +219,14 @@ async def user_actions(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 
 
 @log(logger)
+@with_session
 async def remove_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Removing the specific user"""
 
     await update.callback_query.answer()
     context.user_data["message"] = update.callback_query.message
     user = context.user_data["user"]
-    async_session = await create_session()
-    async with async_session() as session:
-        user_delete = await delete_user(session=session, user=user)
+    user_delete = await delete_user(session=context.session, user=user)
     if user_delete:
         extra_text = f"Пользователь {user.username} удален"
     else:
@@ -290,6 +288,7 @@ async def download_db(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     """Download the database for administrator"""
 
     file = await update.effective_message.document.get_file()
+    await reset_connections()
     await file.download_to_drive("database.db")
     await update.message.delete()
 
@@ -304,6 +303,7 @@ async def upload_db(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Upload database for the administrator"""
     message = context.user_data["message"]
     chat_id = message.chat_id
+    await checkpoint()
     await context.bot.send_document(
         chat_id=chat_id,
         document="database.db",
@@ -1,6 +1,8 @@
 from sqlalchemy import delete, exists, select
 from sqlalchemy.ext.asyncio.session import AsyncSession
 
+from source.bot.users.queries import users_cache
+from source.database.cache import MISSING
 from source.database.models import User
 from source.settings import get_logger
 
@@ -17,6 +19,7 @@ async def insert_admin_or_update(
     if user:
         user.is_admin = True
         await session.commit()
+        users_cache.invalidate()
         return True
     else:
         user = User(username=username, chat_id=chat_id, is_admin=True)
@@ -26,16 +29,24 @@ async def insert_admin_or_update(
     except Exception as ex:
         logger.error(ex)
         return False
+    finally:
+        users_cache.invalidate()
     return True
 
 
 async def admin_exists(session: AsyncSession, username: str) -> None:
     """Check if current user is an admin"""
 
+    cache_key = ("admin_exists", username)
+    result = users_cache.get(cache_key)
+    if result is not MISSING:
+        return result
+
     query = (
         exists(User).where(User.username == username, User.is_admin == True).select()
     )
     result = await session.scalar(query)
+    users_cache.set(cache_key, result)
     return result
 
 
@@ -47,4 +58,6 @@ async def delete_user(session: AsyncSession, user: User) -> bool:
     except Exception as ex:
         logger.error(ex)
         return False
+    finally:
+        users_cache.invalidate()
     return True
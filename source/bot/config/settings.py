@@ -2,3 +2,60 @@ import os
 
 # Timeout for each conversation
 TIMEOUT_CONVERSATION = int(os.environ.get("TIMEOUT_CONVERSATION", 300))  # seconds
+
+# Max number of price points inserted by one statement
+PRICE_POINTS_BATCH_SIZE = int(os.environ.get("PRICE_POINTS_BATCH_SIZE", 500))
+
+# Number of price changes written by one transaction of the refresh job
+REFRESH_BATCH_SIZE = int(os.environ.get("REFRESH_BATCH_SIZE", 100))
+
+# Log the refresh progress after each N products
+REFRESH_PROGRESS_EVERY = int(os.environ.get("REFRESH_PROGRESS_EVERY", 100))
+
+# How often the event loop lag is measured
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", 0.5))  # seconds
+
+# How products are refreshed: "fixed" (all of them every SEND_EVERY seconds),
+# "adaptive" (each product on its own schedule) or "rolling" (a slot of products
+# at a time, all of them every SEND_EVERY seconds)
+SCHEDULE_MODE = os.environ.get("SCHEDULE_MODE", "fixed")
+# How often the adaptive scheduler looks for due products
+SCHEDULER_TICK = int(os.environ.get("SCHEDULER_TICK", 60))  # seconds
+# Max number of products refreshed by one tick, the rest wait for the next ones
+SCHEDULER_MAX_PER_TICK = int(os.environ.get("SCHEDULER_MAX_PER_TICK", 500))
+# Bounds of the interval between checks of a product
+REFRESH_MIN_INTERVAL = int(os.environ.get("REFRESH_MIN_INTERVAL", 600))  # seconds
+REFRESH_MAX_INTERVAL = int(os.environ.get("REFRESH_MAX_INTERVAL", 86400))  # seconds
+# The price history used to estimate how often the price changes
+REFRESH_HISTORY_DAYS = int(os.environ.get("REFRESH_HISTORY_DAYS", 30))
+# Checks between two expected price changes
+REFRESH_CHECKS_PER_CHANGE = int(os.environ.get("REFRESH_CHECKS_PER_CHANGE", 4))
+
+# The rolling mode: number of slots in SEND_EVERY seconds and the max random delay
+# of a tick
+ROLLING_SLOTS = int(os.environ.get("ROLLING_SLOTS", 60))
+ROLLING_JITTER = float(os.environ.get("ROLLING_JITTER", 5))  # seconds
+
+# Telegram allows about 30 messages per second in all and 1 per second to a chat
+NOTIFY_RATE = float(os.environ.get("NOTIFY_RATE", 30))  # messages per second
+# The dispatcher of the notification outbox, by default a batch is what can be
+# sent until the next run
+DISPATCH_INTERVAL = float(os.environ.get("DISPATCH_INTERVAL", 2))  # seconds
+DISPATCH_BATCH_SIZE = int(os.environ.get("DISPATCH_BATCH_SIZE", int(NOTIFY_RATE * DISPATCH_INTERVAL)))
+# Max number of notifications put into the outbox by one statement
+NOTIFICATIONS_BATCH_SIZE = int(os.environ.get("NOTIFICATIONS_BATCH_SIZE", 500))
+NOTIFY_CHAT_INTERVAL = float(os.environ.get("NOTIFY_CHAT_INTERVAL", 1))  # seconds
+# A notification is given up after N failed attempts
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get("NOTIFY_MAX_ATTEMPTS", 5))
+# Sent and failed notifications are kept for N days
+NOTIFY_KEEP_DAYS = int(os.environ.get("NOTIFY_KEEP_DAYS", 7))
+# Merge notifications for a chat into one message (a digest), the changes of the
+# window are waited for to get into the same digest
+NOTIFY_DIGEST = os.environ.get("NOTIFY_DIGEST", "True") == "True"
+NOTIFY_DIGEST_WINDOW = int(os.environ.get("NOTIFY_DIGEST_WINDOW", 60))  # seconds
+# The max length of a Telegram message
+MESSAGE_MAX_LENGTH = 4096
+# Messages sent at the same time
+NOTIFY_CONCURRENCY = int(os.environ.get("NOTIFY_CONCURRENCY", 10))
+# A user is inactive after N notifications failed for good in a row
+NOTIFY_MAX_FAILURES = int(os.environ.get("NOTIFY_MAX_FAILURES", 3))
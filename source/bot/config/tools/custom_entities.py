@@ -1,5 +1,10 @@
-from dataclasses import dataclass
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
 
+from sqlalchemy.ext.asyncio.session import AsyncSession
 from telegram.ext import Application, CallbackContext, ExtBot
 
 
@@ -11,12 +16,74 @@ class WebhookUpdate:
     payload: str
 
 
+@dataclass
+class CycleStats:
+    """Counters and timings of one refresh cycle"""
+
+    products: int = 0
+    failed: int = 0
+    # Products that failed, the scheduler retries them soon
+    failed_ids: list[int] = field(default_factory=list)
+    # Pages that aren't modified (304 or the same fingerprint) and parsed pages
+    skipped: int = 0
+    parsed: int = 0
+    # Bytes of product pages downloaded and not downloaded thanks to streaming
+    bytes_read: int = 0
+    bytes_saved: int = 0
+    changed: int = 0
+    # Notifications put into the outbox
+    queued: int = 0
+    # The worst event loop lag during the cycle, seconds
+    max_loop_lag: float = 0.0
+    started_at: float = field(default_factory=time.perf_counter)
+    # Time spent in each stage, summed over concurrent tasks
+    timings: dict[str, float] = field(default_factory=lambda: defaultdict(float))
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] += time.perf_counter() - started_at
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def __str__(self):
+        timings = ", ".join(
+            f"{stage}={seconds:.2f}s" for stage, seconds in self.timings.items()
+        )
+        return (
+            f"products={self.products} failed={self.failed} skipped={self.skipped} "
+            f"parsed={self.parsed} changed={self.changed} "
+            f"queued={self.queued} read={self.bytes_read // 1024}KB "
+            f"saved={self.bytes_saved // 1024}KB elapsed={self.elapsed:.2f}s "
+            f"max_loop_lag={self.max_loop_lag * 1000:.0f}ms ({timings})"
+        )
+
+
 class CustomContext(CallbackContext[ExtBot, dict, dict, dict]):
     """
     Custom CallbackContext class that makes `user_data` available for updates of type
     `WebhookUpdate`.
     """
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._session: AsyncSession | None = None
+
+    @property
+    def session(self) -> AsyncSession | None:
+        """The DB session of the current update (see the `with_session` decorator)"""
+
+        return self._session
+
+    @session.setter
+    def session(self, value: AsyncSession | None) -> None:
+        self._session = value
+
     @classmethod
     def from_update(
         cls,
@@ -1,9 +1,12 @@
+from functools import wraps
 from logging import Logger
 from typing import Any, Callable
 
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from source.database.engine import create_session
+
 
 def log(logger: Logger) -> Callable[[Any], Callable[[Update, Any], Any]]:
     """Decorator for logging the metadata of the bot command"""
@@ -25,3 +28,26 @@ def log(logger: Logger) -> Callable[[Any], Callable[[Update, Any], Any]]:
         return wrapper
 
     return decorator_wrapper
+
+
+def with_session(function) -> Callable[[Update, Any], Any]:
+    """Decorator for sharing one DB session by all queries of the update
+
+    The session is available as `context.session`.
+    Nested calls (e.g. `back` calls `start`) reuse the session of the caller.
+    """
+
+    @wraps(function)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if context.session is not None:
+            return await function(update, context)
+
+        async_session = await create_session()
+        async with async_session() as session:
+            context.session = session
+            try:
+                return await function(update, context)
+            finally:
+                context.session = None
+
+    return wrapper
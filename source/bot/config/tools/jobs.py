@@ -1,61 +1,364 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Sequence
+
 from aiohttp import ClientSession
 from telegram.ext import ContextTypes
 
-from source.bot.products.queries import select_products, update_product
-from source.parsers import onliner
+from source.bot.config.settings import REFRESH_BATCH_SIZE, REFRESH_PROGRESS_EVERY, ROLLING_SLOTS
+from source.bot.config.tools.custom_entities import CycleStats
+from source.bot.config.tools.monitoring import loop_lag
+from source.bot.config.tools.scheduler import get_slot, scheduler
+from source.bot.notifications.queries import insert_notifications
+from source.bot.products.queries import (
+    TrackedProduct,
+    select_alerts,
+    select_tracked_products,
+    update_pages,
+    update_prices,
+)
+from source.database.engine import create_session
+from source.parsers import executor, onliner
+from source.parsers.http import HostUnavailable, get_client, request
+from source.parsers.settings import FETCH_CONCURRENCY
 from source.settings import get_logger
 
 logger = get_logger(__name__)
 
+# Marks the end of the stage queue
+DONE = None
 
-async def send_notifications(context: ContextTypes.DEFAULT_TYPE):
-    """Sending notifications about price changes for each product"""
 
-    products = await select_products()
+def get_notification_text(
+    name: str, link: str, previous_price: float, current_price: float, rule: str
+) -> str:
+    """Get the text about the price change that triggered the alert rule"""
 
-    async with ClientSession() as session:
-        for product in products:
-            url = product.product_link
+    if rule == "in_stock":
+        return f"""\U00002705{name}
 
-            # Received a product price by URL
-            data = await onliner.parse(session, url)
+{link}
 
-            if not data:
-                logger.error(f"Something is wrong. The product={url}")
-            else:
-                _, new_price = data
-                if new_price != product.current_price:
-                    updated_product = await update_product(
-                        product=product, price=new_price
-                    )
-                    chat_ids = [user.chat_id for user in updated_product.users]
-
-                    # Product data
-                    current_price = updated_product.current_price
-                    previous_price = updated_product.previous_price
-                    link = updated_product.product_link
-                    name = updated_product.name
-
-                    # Count a difference
-                    different = current_price - previous_price
-                    different = round(different, 2)
-                    if abs(different) >= 1:
-                        word = "снизилась" if different < 0 else "выросла"
-                        emoji = "\U0001F601" if different < 0 else "\U0001F621"
-
-                        notification_text = f"""{emoji}{name}
-                    
-{link}  
-    
-Цена {word} на {abs(different)} BYN
+Товар снова в наличии
+Цена = {current_price} BYN"""
+
+    if rule == "target":
+        return f"""\U0001F3AF{name}
+
+{link}
+
+Цена достигла желаемой
 Предыдущая цена = {previous_price} BYN
 Новая цена = {current_price} BYN"""
 
-                        for chat_id in chat_ids:
-                            await context.bot.send_message(
-                                chat_id=chat_id, text=notification_text
-                            )
-                else:
-                    pass
+    # Count a difference
+    different = current_price - previous_price
+    different = round(different, 2)
+
+    word = "снизилась" if different < 0 else "выросла"
+    emoji = "\U0001F601" if different < 0 else "\U0001F621"
+    percent = ""
+    if rule == "percent":
+        percent = f" ({abs(different) / previous_price:.0%})"
+
+    return f"""{emoji}{name}
+
+{link}
+
+Цена {word} на {abs(different)} BYN{percent}
+Предыдущая цена = {previous_price} BYN
+Новая цена = {current_price} BYN"""
+
+
+async def read_products(
+    products_queue: asyncio.Queue,
+    workers: int,
+    product_ids: list[int] = None,
+    slot: tuple[int, int] = None,
+) -> None:
+    """Stage 1: read tracked products from the database page by page
+
+    Each page is read by a short session that is closed before its products are
+    queued, so the reader doesn't hold a transaction while the writer commits
+    """
+
+    # All products or the given ones by batches
+    if product_ids is None:
+        batches = [None]
+    else:
+        batches = [
+            product_ids[start:start + REFRESH_BATCH_SIZE]
+            for start in range(0, len(product_ids), REFRESH_BATCH_SIZE)
+        ]
+
+    async_session = await create_session()
+    for batch in batches:
+        last_id = 0
+        while True:
+            async with async_session() as session:
+                products = await select_tracked_products(
+                    session=session,
+                    after_id=last_id,
+                    limit=REFRESH_BATCH_SIZE,
+                    product_ids=batch,
+                    slot=slot,
+                )
+            for product in products:
+                await products_queue.put(product)
+            if len(products) < REFRESH_BATCH_SIZE:
+                break
+            last_id = products[-1].id
+
+    for _ in range(workers):
+        await products_queue.put(DONE)
+
+
+async def load_page(
+    http_session: ClientSession, product: TrackedProduct, stats: CycleStats
+) -> tuple:
+    """Download and parse the product page within the limits of its host
+
+    Return the page, its fingerprint and the name and price. The name and price are
+    None if the page isn't changed since the last parse.
+    """
+
+    with stats.measure("fetch"):
+        page = await request(
+            product.link,
+            lambda: onliner.fetch_page(
+                http_session, product.link, product.etag, product.last_modified
+            ),
+        )
+    stats.bytes_read += page.size
+    if page.text is None:
+        return page, None, None
+
+    with stats.measure("parse"):
+        fingerprint, data = await executor.run(
+            onliner.extract_changed, page.text, product.fingerprint
+        )
+    if data is not None and data[0] is None and page.partial:
+        # Read the whole page if the cut one confuses the parser
+        with stats.measure("fetch"):
+            page = await request(
+                product.link,
+                lambda: onliner.fetch_page(http_session, product.link, stream=False),
+            )
+        stats.bytes_read += page.size
+        with stats.measure("parse"):
+            fingerprint, data = await executor.run(onliner.extract_changed, page.text)
+    else:
+        # Saved bytes count only if the cut page was enough
+        stats.bytes_saved += page.saved
+    return page, fingerprint, data
+
+
+async def refresh_products(
+    http_session: ClientSession,
+    products_queue: asyncio.Queue,
+    changes_queue: asyncio.Queue,
+    stats: CycleStats,
+) -> None:
+    """Stage 2: fetch, parse and compare prices, several workers run at once"""
+
+    while (product := await products_queue.get()) is not DONE:
+        product: TrackedProduct
+        stats.products += 1
+        if stats.products % REFRESH_PROGRESS_EVERY == 0:
+            logger.info(f"Refresh progress: {stats}")
+
+        try:
+            page, fingerprint, data = await load_page(http_session, product, stats)
+        except HostUnavailable as ex:
+            stats.failed += 1
+            stats.failed_ids.append(product.id)
+            logger.warning(f"The host is paused ({ex}), the product={product.link}")
+            continue
+        except Exception as ex:
+            stats.failed += 1
+            stats.failed_ids.append(product.id)
+            logger.error(f"Something is wrong. The product={product.link} ({ex!r})")
+            continue
+        if page.text is None:
+            stats.skipped += 1
+            continue
+
+        change = {
+            "product_id": product.id,
+            "etag": page.etag,
+            "last_modified": page.last_modified,
+            "fingerprint": fingerprint,
+        }
+        page_changed = (page.etag, page.last_modified, fingerprint) != (
+            product.etag,
+            product.last_modified,
+            product.fingerprint,
+        )
+
+        if data is None:
+            stats.skipped += 1
+            if page_changed:
+                await changes_queue.put(change)
+            continue
+
+        stats.parsed += 1
+        name, new_price = data
+        if name is None:
+            stats.failed += 1
+            stats.failed_ids.append(product.id)
+            logger.error(f"Something is wrong. The product={product.link}")
+        elif new_price != product.price:
+            change.update(
+                {
+                    "price": new_price,
+                    "previous_price": product.price,
+                    "name": product.name,
+                    "link": product.link,
+                }
+            )
+            await changes_queue.put(change)
+        elif page_changed:
+            await changes_queue.put(change)
+
+
+def get_notifications(
+    changes: list[dict], alerts: Sequence[Any], now: datetime
+) -> list[dict]:
+    """Outbox rows for the (chat ID, product ID, rule) rows of triggered alerts
+
+    The text is built once for each product and rule, not for each subscriber
+    """
+
+    changes = {change["product_id"]: change for change in changes}
+    texts = {}
+    notifications = []
+    for chat_id, product_id, rule in alerts:
+        text = texts.get((product_id, rule))
+        if text is None:
+            change = changes[product_id]
+            text = texts[product_id, rule] = get_notification_text(
+                name=change["name"],
+                link=change["link"],
+                previous_price=change["previous_price"],
+                current_price=change["price"],
+                rule=rule,
+            )
+        notifications.append({"chat_id": chat_id, "text": text, "created_at": now})
+    return notifications
+
+
+async def write_changes(changes_queue: asyncio.Queue, stats: CycleStats) -> None:
+    """Stage 3: save price changes, page states and notifications in batches
+
+    Notifications are sent by the dispatcher from the outbox, they are written in the
+    same transaction as prices, so a crash loses neither
+    """
+
+    async_session = await create_session()
+    batch = []
+    done = False
+    while not done:
+        change = await changes_queue.get()
+        if change is DONE:
+            done = True
+        else:
+            batch.append(change)
+
+        if batch and (done or len(batch) >= REFRESH_BATCH_SIZE):
+            changes = [change for change in batch if "price" in change]
+            with stats.measure("write"):
+                async with async_session() as session:
+                    await update_pages(session=session, pages=batch)
+                    await update_prices(session=session, changes=changes)
+                    alerts = await select_alerts(
+                        session=session,
+                        product_ids=[change["product_id"] for change in changes],
+                    )
+                    notifications = get_notifications(changes, alerts, datetime.now())
+                    await insert_notifications(
+                        session=session, notifications=notifications
+                    )
+                    # A batch can have page states only
+                    await session.commit()
+            stats.changed += len(changes)
+            stats.queued += len(notifications)
+            batch = []
+
+
+async def refresh(
+    product_ids: list[int] = None, slot: tuple[int, int] = None
+) -> CycleStats:
+    """Refresh prices of products and queue notifications about changes
+
+    The stages are connected by queues, so a slow page delays only itself
+    """
+
+    stats = CycleStats()
+    workers = FETCH_CONCURRENCY
+    products_queue = asyncio.Queue(maxsize=workers * 2)
+    changes_queue = asyncio.Queue()
+
+    http_session = get_client()
+
+    async def run_workers() -> None:
+        await asyncio.gather(
+            *(
+                refresh_products(http_session, products_queue, changes_queue, stats)
+                for _ in range(workers)
+            )
+        )
+        await changes_queue.put(DONE)
+
+    tasks = [
+        asyncio.create_task(read_products(products_queue, workers, product_ids, slot)),
+        asyncio.create_task(run_workers()),
+        asyncio.create_task(write_changes(changes_queue, stats)),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # Don't leave stages waiting for each other forever
+        for task in tasks:
+            task.cancel()
+        raise
+
+    stats.max_loop_lag = loop_lag.max_since(stats.started_at)
+    return stats
+
+
+async def send_notifications(context: ContextTypes.DEFAULT_TYPE):
+    """Refresh prices of all products, notifications go to the outbox"""
+
+    stats = await refresh()
+    logger.info(f"All products have been refreshed: {stats}")
+
+
+async def refresh_scheduled(context: ContextTypes.DEFAULT_TYPE):
+    """Refresh products which are due by the adaptive schedule"""
+
+    now = datetime.now()
+    async_session = await create_session()
+    async with async_session() as session:
+        await scheduler.sync(session=session, now=now)
+    product_ids = scheduler.pop_due(now=now)
+    if not product_ids:
+        return
+
+    stats = await refresh(product_ids=product_ids)
+    async with async_session() as session:
+        await scheduler.reschedule(
+            session=session,
+            product_ids=product_ids,
+            now=datetime.now(),
+            failed_ids=stats.failed_ids,
+        )
+    logger.info(f"Scheduled products are refreshed ({len(scheduler)} queued): {stats}")
+
+
+async def refresh_slot(context: ContextTypes.DEFAULT_TYPE):
+    """Refresh products of the current time slot"""
 
-        logger.info("All notifications have been sent")
+    slot = get_slot(time.time())
+    stats = await refresh(slot=(slot, ROLLING_SLOTS))
+    logger.info(f"The slot {slot} of {ROLLING_SLOTS} is refreshed: {stats}")
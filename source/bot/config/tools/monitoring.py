@@ -0,0 +1,50 @@
+import asyncio
+import time
+from collections import deque
+
+from source.bot.config.settings import LOOP_LAG_INTERVAL
+
+
+class LoopLagMonitor:
+    """Measure how late the event loop wakes up a sleeping task
+
+    A big lag means that something blocks the loop, and updates wait for it.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, size: int = 1000) -> None:
+        self.interval = interval
+        # (time of the measure, lag in seconds)
+        self.samples: deque[tuple[float, float]] = deque(maxlen=size)
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        while True:
+            started_at = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self.samples.append((now, max(0.0, now - started_at - self.interval)))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        self._task = None
+
+    def max_since(self, since: float) -> float:
+        """The max lag measured after the `time.perf_counter()` value"""
+
+        return max((lag for at, lag in self.samples if at >= since), default=0.0)
+
+    def stats(self) -> dict:
+        lags = [lag for _, lag in self.samples]
+        return {
+            "last": lags[-1] if lags else 0.0,
+            "avg": sum(lags) / len(lags) if lags else 0.0,
+            "max": max(lags, default=0.0),
+        }
+
+
+loop_lag = LoopLagMonitor()
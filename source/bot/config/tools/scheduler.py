@@ -0,0 +1,133 @@
+import heapq
+import math
+import random
+from datetime import datetime, timedelta
+from typing import Collection
+
+from sqlalchemy.ext.asyncio.session import AsyncSession
+
+from source.bot.config.settings import (
+    REFRESH_CHECKS_PER_CHANGE,
+    REFRESH_HISTORY_DAYS,
+    REFRESH_MAX_INTERVAL,
+    REFRESH_MIN_INTERVAL,
+    ROLLING_SLOTS,
+    SCHEDULER_MAX_PER_TICK,
+)
+from source.bot.products.queries import select_refresh_history, select_schedule, update_next_checks
+from source.settings import SEND_DELAY, get_logger
+
+logger = get_logger(__name__)
+
+
+def get_interval(changes: int, subscribers: int, since_change: float) -> float:
+    """Seconds until the next check of the product
+
+    The product is checked several times between its expected price changes. A price
+    that changed recently is likely to change again soon, and a product with many
+    subscribers is checked more often.
+    """
+
+    window = timedelta(days=REFRESH_HISTORY_DAYS).total_seconds()
+    expected_gap = window / changes if changes else math.inf
+    interval = min(expected_gap, since_change) / REFRESH_CHECKS_PER_CHANGE
+    interval /= 1 + math.log2(max(subscribers, 1))
+    return min(max(interval, REFRESH_MIN_INTERVAL), REFRESH_MAX_INTERVAL)
+
+
+def get_slot(
+    timestamp: float, interval: int = SEND_DELAY, slots: int = ROLLING_SLOTS
+) -> int:
+    """The slot of the rolling mode by the wall clock
+
+    Slots don't depend on the start time, so a restart continues the same round
+    """
+
+    return int(timestamp // (interval / slots)) % slots
+
+
+def get_slot_delay(
+    timestamp: float, interval: int = SEND_DELAY, slots: int = ROLLING_SLOTS
+) -> float:
+    """Seconds until the next slot starts"""
+
+    duration = interval / slots
+    return duration - timestamp % duration
+
+
+class RefreshScheduler:
+    """A priority queue of products ordered by the time of their next check
+
+    The schedule is stored in `Product.next_check_at`, so it survives restarts. The
+    queue is reloaded from the database every REFRESH_MIN_INTERVAL seconds to pick up
+    new products and drop untracked ones.
+    """
+
+    def __init__(self) -> None:
+        self._heap: list[tuple[datetime, int]] = []
+        self._loaded_at: datetime | None = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    async def sync(self, session: AsyncSession, now: datetime) -> None:
+        """Reload the queue from the database if it's time"""
+
+        if self._loaded_at and now - self._loaded_at < timedelta(
+            seconds=REFRESH_MIN_INTERVAL
+        ):
+            return
+
+        heap = []
+        for product_id, next_check_at in await select_schedule(session=session):
+            if next_check_at is None:
+                # Spread products that were never scheduled instead of checking
+                # all of them at once
+                delay = random.uniform(0, REFRESH_MIN_INTERVAL)
+                next_check_at = now + timedelta(seconds=delay)
+            heap.append((next_check_at, product_id))
+        heapq.heapify(heap)
+        self._heap = heap
+        self._loaded_at = now
+        logger.info(f"The refresh schedule is loaded ({len(heap)} products)")
+
+    def pop_due(self, now: datetime, limit: int = SCHEDULER_MAX_PER_TICK) -> list[int]:
+        """Take IDs of products that have to be checked"""
+
+        product_ids = []
+        while self._heap and self._heap[0][0] <= now and len(product_ids) < limit:
+            product_ids.append(heapq.heappop(self._heap)[1])
+        return product_ids
+
+    async def reschedule(
+        self,
+        session: AsyncSession,
+        product_ids: list[int],
+        now: datetime,
+        failed_ids: Collection[int] = (),
+    ) -> None:
+        """Plan the next checks of the refreshed products
+
+        Failed products are retried in REFRESH_MIN_INTERVAL, so an outage of a host
+        doesn't push them far by the schedule
+        """
+
+        failed_ids = set(failed_ids)
+        since = now - timedelta(days=REFRESH_HISTORY_DAYS)
+        rows = await select_refresh_history(
+            session=session, product_ids=product_ids, since=since
+        )
+        schedule = []
+        for product_id, subscribers, changes, last_change in rows:
+            since_change = (now - last_change).total_seconds() if last_change else 0
+            if product_id in failed_ids:
+                interval = REFRESH_MIN_INTERVAL
+            else:
+                interval = get_interval(changes, subscribers, since_change)
+            next_check_at = now + timedelta(seconds=interval)
+            heapq.heappush(self._heap, (next_check_at, product_id))
+            schedule.append({"product_id": product_id, "next_check_at": next_check_at})
+        await update_next_checks(session=session, schedule=schedule)
+
+
+scheduler = RefreshScheduler()
@@ -0,0 +1,249 @@
+import time
+from datetime import datetime, timedelta
+from typing import Any, Sequence
+
+from sqlalchemy.ext.asyncio.session import AsyncSession
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+from telegram.ext import ContextTypes
+
+from source.bot.config.settings import (
+    DISPATCH_BATCH_SIZE,
+    DISPATCH_INTERVAL,
+    MESSAGE_MAX_LENGTH,
+    NOTIFY_CHAT_INTERVAL,
+    NOTIFY_DIGEST,
+    NOTIFY_DIGEST_WINDOW,
+    NOTIFY_KEEP_DAYS,
+    NOTIFY_MAX_ATTEMPTS,
+    NOTIFY_MAX_FAILURES,
+)
+from source.bot.notifications.fanout import Message, fan_out
+from source.bot.notifications.queries import (
+    delete_finished,
+    fail_pending,
+    mark_delivered,
+    select_pending,
+    update_attempts,
+)
+from source.bot.users.queries import record_delivery_failures, reset_delivery_failures
+from source.database.engine import create_session
+from source.settings import get_logger
+
+logger = get_logger(__name__)
+
+
+def split_text(text: str, limit: int = MESSAGE_MAX_LENGTH) -> list[str]:
+    return [text[start:start + limit] for start in range(0, len(text), limit)]
+
+
+def build_messages(
+    notifications: Sequence[Any],
+    now: datetime,
+    digest: bool = NOTIFY_DIGEST,
+    window: int = NOTIFY_DIGEST_WINDOW,
+) -> list[Message]:
+    """Turn outbox rows into messages
+
+    In the digest mode rows of a chat are merged into as few messages as the length
+    limit allows. A chat waits until its oldest row is `window` seconds old, so the
+    rest of the refresh cycle gets into the same digest.
+    """
+
+    if not digest:
+        return [
+            Message(notification.chat_id, piece, [notification])
+            for notification in notifications
+            for piece in split_text(notification.text)
+        ]
+
+    chats: dict[int, list] = {}
+    for notification in notifications:
+        chats.setdefault(notification.chat_id, []).append(notification)
+
+    messages = []
+    ready_before = now - timedelta(seconds=window)
+    for chat_id, chat_notifications in chats.items():
+        if chat_notifications[0].created_at > ready_before:
+            continue
+
+        text = ""
+        rows = []
+        for notification in chat_notifications:
+            if rows and len(text) + 2 + len(notification.text) > MESSAGE_MAX_LENGTH:
+                messages.append(Message(chat_id, text, rows))
+                text, rows = "", []
+            if len(notification.text) > MESSAGE_MAX_LENGTH:
+                # Too long for a digest, it goes by pieces
+                messages.extend(
+                    Message(chat_id, piece, [notification])
+                    for piece in split_text(notification.text)
+                )
+                continue
+            text = f"{text}\n\n{notification.text}" if rows else notification.text
+            rows.append(notification)
+        if rows:
+            messages.append(Message(chat_id, text, rows))
+    return messages
+
+
+class ChatLimiter:
+    """Keep the interval between messages to one chat"""
+
+    def __init__(self, interval: float = NOTIFY_CHAT_INTERVAL) -> None:
+        self.interval = interval
+        self._sent_at: dict[int, float] = {}
+
+    def is_ready(self, chat_id: int) -> bool:
+        sent_at = self._sent_at.get(chat_id)
+        return sent_at is None or time.monotonic() - sent_at >= self.interval
+
+    def record(self, chat_id: int) -> None:
+        self._sent_at[chat_id] = time.monotonic()
+
+    def prune(self) -> None:
+        """Forget chats that are ready anyway"""
+
+        now = time.monotonic()
+        self._sent_at = {
+            chat_id: sent_at
+            for chat_id, sent_at in self._sent_at.items()
+            if now - sent_at < self.interval
+        }
+
+
+def is_unreachable(error: TelegramError) -> bool:
+    """The bot is blocked or the chat doesn't exist, retrying won't help"""
+
+    return isinstance(error, Forbidden) or (
+        isinstance(error, BadRequest) and "chat not found" in error.message.lower()
+    )
+
+
+def get_failed_attempt(
+    notification_id: int, attempt: int, error: TelegramError, now: datetime
+) -> dict:
+    """The new state of the notification that wasn't sent"""
+
+    attempt += 1
+    given_up = isinstance(error, BadRequest) or is_unreachable(error)
+    given_up = given_up or attempt >= NOTIFY_MAX_ATTEMPTS
+    delay = timedelta(seconds=DISPATCH_INTERVAL * 2**attempt)
+    return {
+        "notification_id": notification_id,
+        "status": "failed" if given_up else "pending",
+        "attempts": attempt,
+        "next_attempt_at": None if given_up else now + delay,
+    }
+
+
+class Dispatcher:
+    """Send notifications from the outbox within the limits of Telegram
+
+    A notification is marked delivered after it's sent, so a crash between the two
+    sends it again: the delivery is at least once.
+    """
+
+    def __init__(self) -> None:
+        self.chat_limiter = ChatLimiter()
+        # Telegram asked to wait (RetryAfter) until this `time.monotonic()` value
+        self.paused_until = 0.0
+
+    async def run(self, bot: Bot) -> dict:
+        """Send one batch of pending notifications, return counters of outcomes"""
+
+        stats = {"messages": 0, "delivered": 0, "retried": 0, "failed": 0}
+        if time.monotonic() < self.paused_until:
+            return stats
+
+        now = datetime.now()
+        async_session = await create_session()
+        async with async_session() as session:
+            notifications = await select_pending(
+                session=session, now=now, limit=DISPATCH_BATCH_SIZE
+            )
+        if not notifications:
+            return stats
+
+        # One message to a chat per batch, the next batch takes the rest
+        self.chat_limiter.prune()
+        messages = []
+        for message in build_messages(notifications, now):
+            if self.chat_limiter.is_ready(message.chat_id):
+                self.chat_limiter.record(message.chat_id)
+                messages.append(message)
+
+        delivered = []
+        attempts = []
+        reached = []
+        unreachable = []
+        for message, error in await fan_out(bot=bot, messages=messages):
+            if error is None:
+                reached.append(message.chat_id)
+                stats["messages"] += 1
+                stats["delivered"] += len(message.notifications)
+                delivered.extend(row.id for row in message.notifications)
+            elif isinstance(error, RetryAfter):
+                # The flood limit is global, the message goes after the pause
+                self.paused_until = time.monotonic() + error.retry_after
+                logger.warning(f"Notifications are paused for {error.retry_after}s")
+            else:
+                logger.error(
+                    f"The message for chat ID={message.chat_id} failed ({error!r})"
+                )
+                if is_unreachable(error):
+                    unreachable.append(message.chat_id)
+                for row in message.notifications:
+                    attempts.append(
+                        get_failed_attempt(row.id, row.attempts, error, now)
+                    )
+                    given_up = attempts[-1]["status"] == "failed"
+                    stats["failed" if given_up else "retried"] += 1
+
+        async with async_session() as session:
+            await mark_delivered(
+                session=session, notification_ids=delivered, now=datetime.now()
+            )
+            await update_attempts(session=session, attempts=attempts)
+            await self.update_users(session, reached, unreachable)
+        return stats
+
+    @staticmethod
+    async def update_users(
+        session: AsyncSession, reached: list[int], unreachable: list[int]
+    ) -> None:
+        """Track failures in a row of chats, deactivate users that can't be reached"""
+
+        if reached:
+            await reset_delivery_failures(session=session, chat_ids=reached)
+        if not unreachable:
+            return
+
+        deactivated = await record_delivery_failures(
+            session=session, chat_ids=unreachable, max_failures=NOTIFY_MAX_FAILURES
+        )
+        if deactivated:
+            # Otherwise the next batches would try them again
+            await fail_pending(session=session, chat_ids=deactivated)
+            logger.info(f"Unreachable users are deactivated (chat IDs={deactivated})")
+
+
+dispatcher = Dispatcher()
+
+
+async def dispatch_notifications(context: ContextTypes.DEFAULT_TYPE):
+    """Drain the notification outbox"""
+
+    stats = await dispatcher.run(context.bot)
+    if any(stats.values()):
+        logger.info(f"Notifications are dispatched: {stats}")
+
+
+async def purge_notifications(context: ContextTypes.DEFAULT_TYPE):
+    """Delete old delivered and failed notifications"""
+
+    before = datetime.now() - timedelta(days=NOTIFY_KEEP_DAYS)
+    async_session = await create_session()
+    async with async_session() as session:
+        deleted = await delete_finished(session=session, before=before)
+    logger.info(f"Old notifications are deleted ({deleted})")
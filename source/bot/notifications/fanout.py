@@ -0,0 +1,64 @@
+import asyncio
+from typing import Any, Iterable, NamedTuple
+
+from telegram import Bot
+from telegram.error import RetryAfter, TelegramError
+
+from source.bot.config.settings import NOTIFY_CONCURRENCY, NOTIFY_RATE
+from source.parsers.http import TokenBucket
+
+# Telegram limits messages of the bot in all, so every sender shares the limiter
+rate_limiter = TokenBucket(rate=NOTIFY_RATE, burst=int(NOTIFY_RATE))
+
+
+class Message(NamedTuple):
+    """A message to send and the outbox rows it delivers"""
+
+    chat_id: int
+    text: str
+    notifications: list[Any]
+
+
+class Outcome(NamedTuple):
+    message: Message
+    error: TelegramError | None  # None if the message is sent
+
+
+async def fan_out(
+    bot: Bot,
+    messages: Iterable[Message],
+    concurrency: int = NOTIFY_CONCURRENCY,
+    limiter: TokenBucket = rate_limiter,
+) -> list[Outcome]:
+    """Send messages by several workers within the rate limit
+
+    After RetryAfter no new messages are taken, messages without an outcome weren't
+    tried. The caller keeps messages to one chat apart, they may go at once.
+    """
+
+    pending = iter(messages)
+    outcomes = []
+    flood_wait = False
+
+    async def worker() -> None:
+        nonlocal flood_wait
+
+        # The iterator is shared, each message is taken by one worker
+        for message in pending:
+            await limiter.take()
+            if flood_wait:
+                return
+            try:
+                await bot.send_message(chat_id=message.chat_id, text=message.text)
+            except RetryAfter as ex:
+                flood_wait = True
+                outcomes.append(Outcome(message, ex))
+            except TelegramError as ex:
+                outcomes.append(Outcome(message, ex))
+            else:
+                outcomes.append(Outcome(message, None))
+            if flood_wait:
+                return
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return outcomes
@@ -0,0 +1,131 @@
+from datetime import datetime
+from typing import Any, Sequence
+
+from sqlalchemy import Row, RowMapping, bindparam, delete, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio.session import AsyncSession
+
+from source.bot.config.settings import NOTIFICATIONS_BATCH_SIZE
+from source.database.models import Notification
+
+
+async def insert_notifications(
+    session: AsyncSession, notifications: list[dict]
+) -> None:
+    """Put notifications into the outbox without committing
+
+    Each notification is a dict with the "chat_id", "text" and "created_at" keys
+    """
+
+    for start in range(0, len(notifications), NOTIFICATIONS_BATCH_SIZE):
+        batch = notifications[start:start + NOTIFICATIONS_BATCH_SIZE]
+        await session.execute(insert(Notification), batch)
+
+
+async def select_pending(
+    session: AsyncSession, now: datetime, limit: int
+) -> Sequence[Row | RowMapping | Any]:
+    """Get notifications ready to be sent, the oldest first in each chat
+
+    Chats take turns: the first rows of all chats go before the second ones, so a
+    chat with a large backlog doesn't hold up the others. Rows of a chat keep their
+    order.
+    """
+
+    turn = (
+        func.row_number()
+        .over(partition_by=Notification.chat_id, order_by=Notification.id)
+        .label("turn")
+    )
+    pending = (
+        select(
+            Notification.id,
+            Notification.chat_id,
+            Notification.text,
+            Notification.attempts,
+            Notification.created_at,
+            turn,
+        )
+        .where(
+            Notification.status == "pending",
+            or_(
+                Notification.next_attempt_at.is_(None),
+                Notification.next_attempt_at <= now,
+            ),
+        )
+        .subquery()
+    )
+    query = (
+        select(
+            pending.c.id,
+            pending.c.chat_id,
+            pending.c.text,
+            pending.c.attempts,
+            pending.c.created_at,
+        )
+        .order_by(pending.c.turn, pending.c.id)
+        .limit(limit)
+    )
+    result = await session.execute(query)
+    return result.all()
+
+
+async def mark_delivered(
+    session: AsyncSession, notification_ids: list[int], now: datetime
+) -> None:
+    if not notification_ids:
+        return
+
+    update_query = (
+        update(Notification)
+        .where(Notification.id.in_(notification_ids))
+        .values(status="delivered", delivered_at=now)
+    )
+    await session.execute(update_query)
+    await session.commit()
+
+
+async def update_attempts(session: AsyncSession, attempts: list[dict]) -> None:
+    """Save failed attempts
+
+    Each attempt is a dict with the "notification_id", "status", "attempts" and
+    "next_attempt_at" keys
+    """
+
+    if not attempts:
+        return
+
+    table = Notification.__table__
+    update_query = (
+        update(table)
+        .where(table.c.id == bindparam("notification_id"))
+        .values(
+            status=bindparam("status"),
+            attempts=bindparam("attempts"),
+            next_attempt_at=bindparam("next_attempt_at"),
+        )
+    )
+    await session.execute(update_query, attempts)
+    await session.commit()
+
+
+async def fail_pending(session: AsyncSession, chat_ids: list[int]) -> None:
+    """Give up pending notifications of chats that can't be reached"""
+
+    update_query = (
+        update(Notification)
+        .where(Notification.chat_id.in_(chat_ids), Notification.status == "pending")
+        .values(status="failed", next_attempt_at=None)
+    )
+    await session.execute(update_query)
+    await session.commit()
+
+
+async def delete_finished(session: AsyncSession, before: datetime) -> int:
+    """Delete delivered and failed notifications created before the date"""
+
+    delete_query = delete(Notification).where(
+        Notification.status != "pending", Notification.created_at < before
+    )
+    result = await session.execute(delete_query)
+    await session.commit()
+    return result.rowcount
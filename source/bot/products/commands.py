@@ -1,28 +1,32 @@
-from aiohttp import ClientSession
+import asyncio
+
+from aiohttp import ClientError
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes, ConversationHandler
 
 from source.bot.config.settings import TIMEOUT_CONVERSATION
-from source.bot.config.tools.decorators import log
+from source.bot.config.tools.decorators import log, with_session
 from source.bot.products.callback_data import END, STATES, STOP
 from source.bot.products.services import (
     add_product,
+    canonicalize_link,
     check_link,
     check_product_in_db,
     check_relationship,
     get_user_products,
     untrack_product,
 )
-from source.bot.users.queries import select_users
+from source.bot.users.queries import activate_user, select_users
 from source.bot.users.services import get_joined_users
-from source.database.engine import create_session
 from source.parsers import onliner
+from source.parsers.http import HostUnavailable, RetryableError, get_client
 from source.settings import get_logger
 
 logger = get_logger(__name__)
 
 
 @log(logger)
+@with_session
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """The starting point for entering the menu"""
 
@@ -44,14 +48,19 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     ]
 
     # Count rows for JoinedUsers
-    async_session = await create_session()
-    async with async_session() as session:
-        joined_users = await get_joined_users(session=session)
-        len_joined_users = len(joined_users)
+    joined_users = await get_joined_users(session=context.session)
+    len_joined_users = len(joined_users)
 
-    users = await select_users(username=update.effective_user.username)
+    users = await select_users(
+        session=context.session, username=update.effective_user.username
+    )
     if users:
         user = users[0]
+        if not user.is_active:
+            # The user unblocked the bot, products are refreshed for them again
+            await activate_user(
+                session=context.session, username=update.effective_user.username
+            )
 
         # Additional option for the admin
         if user.is_admin:
@@ -178,12 +187,13 @@ async def track_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 
 @log(logger)
+@with_session
 async def track_product(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     message = update.message
-    link = message.text
+    link = canonicalize_link(message.text)
 
     product_is_existed = await check_product_in_db(
-        update.effective_chat.username, link=link
+        session=context.session, username=update.effective_chat.username, link=link
     )
     link_is_correct = await check_link(link=link)
     if product_is_existed or not link_is_correct:
@@ -204,25 +214,36 @@ async def track_product(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         return STATES["TRACK"]
 
     else:
-        async with ClientSession() as session:
-            name, price = await onliner.parse(session=session, url=link)
-
-        if not name and not price:
-            logger.error(f"Something is wrong.\nThe product={link}")
-        else:
-            is_added = await add_product(
-                username=update.effective_chat.username,
-                link=link,
-                name=name,
-                price=price,
+        # The DB connection isn't held while the page is downloaded
+        await context.session.close()
+        try:
+            # The user waits for the answer, so a failure isn't retried with backoff
+            name, price = await onliner.parse(
+                session=get_client(), url=link, retries=0
             )
-            if is_added:
-                text = "\U0001F44D Товар был добавлен для отслеживается"
+        except (HostUnavailable, RetryableError, ClientError, asyncio.TimeoutError) as ex:
+            logger.warning(f"The page isn't loaded. The product={link} ({ex!r})")
+            reason = str(ex) or type(ex).__name__
+            text = f"\U00002757 Не удалось загрузить страницу товара ({reason})"
+        else:
+            if not name and not price:
+                logger.error(f"Something is wrong.\nThe product={link}")
+                text = "\U00002757 Не удалось найти товар на странице"
             else:
-                text = "\U00002757 Не удалось добавить товар"
-            await update.message.delete()
-
-            context.user_data["text"] = text
+                is_added = await add_product(
+                    session=context.session,
+                    username=update.effective_chat.username,
+                    link=link,
+                    name=name,
+                    price=price,
+                )
+                if is_added:
+                    text = "\U0001F44D Товар был добавлен для отслеживается"
+                else:
+                    text = "\U00002757 Не удалось добавить товар"
+        await update.message.delete()
+
+        context.user_data["text"] = text
         context.user_data["back"] = True
 
     # Back to the starting point
@@ -232,11 +253,14 @@ async def track_product(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 
 
 @log(logger)
+@with_session
 async def show_products(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
 
-    products = await get_user_products(username=update.effective_chat.username)
+    products = await get_user_products(
+        session=context.session, username=update.effective_chat.username
+    )
     context.user_data["products"] = {
         f"id={callback_index}": product
         for callback_index, product in enumerate(products)
@@ -298,6 +322,7 @@ async def get_product_actions(
 
 
 @log(logger)
+@with_session
 async def remove_product(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
@@ -309,11 +334,13 @@ async def remove_product(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     product_id = int(product_id[3:])
 
     await untrack_product(
-        username=update.effective_chat.username, product_id=product_id
+        session=context.session,
+        username=update.effective_chat.username,
+        product_id=product_id,
     )
 
     # If relationship does not exist it is deleted
-    await check_relationship(product_id=product_id)
+    await check_relationship(session=context.session, product_id=product_id)
 
     # Set extra text for next starting menu
     remove_emoji = "\U0001F534"
@@ -1,114 +1,400 @@
-from datetime import datetime
-from typing import Any, Sequence
+from datetime import datetime, timedelta
+from typing import Any, NamedTuple, Sequence
 
-from sqlalchemy import Row, RowMapping, delete, exists, select
+from sqlalchemy import (
+    Numeric,
+    Row,
+    RowMapping,
+    and_,
+    bindparam,
+    case,
+    cast,
+    delete,
+    exists,
+    func,
+    insert,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.ext.asyncio.session import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from source.database.engine import create_session
-from source.database.models import Product, User
+from source.bot.config.settings import PRICE_POINTS_BATCH_SIZE, REFRESH_MIN_INTERVAL
+from source.database.models import PricePoint, Product, User, users_products
 from source.settings import get_logger
 
 logger = get_logger(__name__)
 
 
-async def exist_product(link: str) -> bool:
+class TrackedProduct(NamedTuple):
+    """A flat product row for the refresh job"""
+
+    id: int
+    link: str
+    price: float
+    name: str
+    etag: str | None
+    last_modified: str | None
+    fingerprint: str | None
+
+
+async def exist_product(session: AsyncSession, link: str) -> bool:
     """Check if the product exists"""
 
-    async_session = await create_session()
-    async with async_session() as session:
-        select_query = select(Product).where(Product.product_link == link)
-        is_existed = await session.scalar(exists(select_query).select())
-        return True if is_existed else False
+    select_query = select(Product).where(Product.product_link == link)
+    is_existed = await session.scalar(exists(select_query).select())
+    return True if is_existed else False
 
 
-async def insert_product(username: str, link: str, name: str, price: float) -> None:
+async def insert_product(
+    session: AsyncSession, username: str, link: str, name: str, price: float
+) -> None:
     """Add a new product for tracking if it doesn't exist"""
 
-    async_session = await create_session()
-    async with async_session() as session:
-        user = await session.scalar(select(User).where(User.username == username))
-        product = Product(
-            product_link=link,
-            name=name,
-            current_price=price,
-            previous_price=price,
-            updated_at=datetime.now(),
-        )
-        product.users.append(user)
-        session.add(product)
-        await session.commit()
+    user = await session.scalar(select(User).where(User.username == username))
+    now = datetime.now()
+    product = Product(
+        product_link=link,
+        name=name,
+        current_price=price,
+        previous_price=price,
+        updated_at=now,
+        # The price is just received
+        next_check_at=now + timedelta(seconds=REFRESH_MIN_INTERVAL),
+    )
+    product.users.append(user)
+    session.add(product)
+    await session.flush()
 
+    # The first point of the price history
+    session.add(PricePoint(product_id=product.id, ts=now, price=price))
+    await session.commit()
 
-async def select_products(params: dict = None) -> Sequence[Row | RowMapping | Any]:
+
+async def select_products(
+    session: AsyncSession, params: dict = None
+) -> Sequence[Row | RowMapping | Any]:
     """Get products by some filter"""
 
     logger.info("Receiving products")
 
-    async_session = await create_session()
-    async with async_session() as session:
-        select_query = select(Product)
+    select_query = select(Product)
 
-        if params:
-            username = params.get("username")
-            link = params.get("link")
-            product_id = params.get("product_id")
+    if params:
+        username = params.get("username")
+        link = params.get("link")
+        product_id = params.get("product_id")
 
-            if username:
-                user_query = select(User).where(User.username == username)
-                user = await session.scalar(user_query)
-                select_query = select_query.where(Product.users.contains(user))
-            if product_id:
-                select_query = select_query.where(Product.id == product_id)
-            if link:
-                select_query = select_query.where(Product.product_link == link)
+        if username:
+            user_query = select(User).where(User.username == username)
+            user = await session.scalar(user_query)
+            select_query = select_query.where(Product.users.contains(user))
+        if product_id:
+            select_query = select_query.where(Product.id == product_id)
+        if link:
+            select_query = select_query.where(Product.product_link == link)
 
-        select_query = select_query.options(selectinload(Product.users))
-        products = await session.scalars(select_query)
-        products = products.all()
+    select_query = select_query.options(selectinload(Product.users))
+    products = await session.scalars(select_query)
+    products = products.all()
 
-        logger.info("Products received")
-        return products
+    logger.info("Products received")
+    return products
 
 
-async def get_product(product_id: int):
+async def get_product(session: AsyncSession, product_id: int):
     """Get a special product by it ID"""
 
-    async_session = await create_session()
-    async with async_session() as session:
-        select_query = select(Product).where(Product.id == product_id)
-        product = await session.scalar(select_query)
-        product = product.__dict__
-        del product["_sa_instance_state"]
-        product["updated_at"] = (product["updated_at"].strftime("%d.%m.%Y, %H:%M:%S"),)
-        return product
-
-
-async def update_product(
-    product: Product, price: float = None, name: str = None
-) -> Product:
-    """Update a specific product"""
-
-    async_session = await create_session()
-    async with async_session() as session:
-        select_query = (
-            select(Product)
-            .where(Product.id == product.id)
-            .options(selectinload(Product.users))
-        )
-        product = await session.scalar(select_query)
-        if name:
-            product.name = name
-        product.previous_price = product.current_price
-        product.current_price = price
-        await session.commit()
-        return product
+    select_query = select(Product).where(Product.id == product_id)
+    product = await session.scalar(select_query)
+    product = product.__dict__
+    del product["_sa_instance_state"]
+    product["updated_at"] = (product["updated_at"].strftime("%d.%m.%Y, %H:%M:%S"),)
+    return product
 
 
-async def remove_product(product_id: int) -> None:
+async def remove_product(session: AsyncSession, product_id: int) -> None:
     """Delete a special product from the table"""
 
-    async_session = await create_session()
-    async with async_session() as session:
-        delete_query = delete(Product).where(Product.id == product_id)
-        await session.execute(delete_query)
-        await session.commit()
+    # SQLite doesn't enforce foreign keys, so the history is deleted explicitly
+    await session.execute(delete(PricePoint).where(PricePoint.product_id == product_id))
+    delete_query = delete(Product).where(Product.id == product_id)
+    await session.execute(delete_query)
+    await session.commit()
+
+
+async def insert_price_points(session: AsyncSession, points: list[dict]) -> None:
+    """Add price points in batches without committing
+
+    Each point is a dict with the "product_id", "ts" and "price" keys
+    """
+
+    for start in range(0, len(points), PRICE_POINTS_BATCH_SIZE):
+        batch = points[start:start + PRICE_POINTS_BATCH_SIZE]
+        await session.execute(insert(PricePoint), batch)
+
+
+async def update_prices(session: AsyncSession, changes: list[dict]) -> None:
+    """Apply price changes without committing
+
+    Each change is a dict with the "product_id" and "price" keys
+    """
+
+    if not changes:
+        return
+
+    now = datetime.now()
+    table = Product.__table__
+
+    # One executemany UPDATE, the old price is moved by the database itself
+    update_query = (
+        update(table)
+        .where(table.c.id == bindparam("product_id"))
+        .values(
+            previous_price=table.c.current_price,
+            current_price=bindparam("price"),
+            updated_at=now,
+        )
+    )
+    await session.execute(
+        update_query,
+        [
+            {"product_id": change["product_id"], "price": change["price"]}
+            for change in changes
+        ],
+    )
+
+    await insert_price_points(
+        session=session,
+        points=[
+            {"product_id": change["product_id"], "ts": now, "price": change["price"]}
+            for change in changes
+        ],
+    )
+
+
+async def select_alerts(
+    session: AsyncSession, product_ids: list[int]
+) -> Sequence[Row | RowMapping | Any]:
+    """Evaluate alert rules of subscriptions to the products whose prices changed
+
+    Must run after `update_prices`, so the previous price is in place. Rows are
+    (chat ID, product ID, rule), only subscriptions with a triggered rule get into
+    the result. A subscription gets one rule, the first of "in_stock", "target",
+    "percent" and "delta" that is on and triggered.
+    """
+
+    if not product_ids:
+        return []
+
+    alert = users_products.c
+    current, previous = Product.current_price, Product.previous_price
+    # Prices have kopecks, the delta is rounded so 10.2 - 9.2 counts as 1
+    delta = func.round(cast(func.abs(current - previous), Numeric), 2)
+    rule = case(
+        (and_(alert.notify_in_stock, previous == 0, current > 0), "in_stock"),
+        (
+            and_(
+                current > 0,
+                current <= alert.target_price,
+                or_(previous == 0, previous > alert.target_price),
+            ),
+            "target",
+        ),
+        (
+            and_(previous > 0, delta * 100 >= alert.alert_pct_delta * previous),
+            "percent",
+        ),
+        (delta >= alert.alert_abs_delta, "delta"),
+    ).label("rule")
+
+    rules = (
+        select(User.chat_id, Product.id.label("product_id"), rule)
+        .join(users_products, users_products.c.products_id == Product.id)
+        .join(User, User.id == users_products.c.users_id)
+        .where(Product.id.in_(product_ids), User.is_active)
+        .subquery()
+    )
+    query = select(rules).where(rules.c.rule.is_not(None))
+    result = await session.execute(query)
+    return result.all()
+
+
+async def update_pages(session: AsyncSession, pages: list[dict]) -> None:
+    """Save the page state of the last parse without committing
+
+    Each page is a dict with the "product_id", "etag", "last_modified" and
+    "fingerprint" keys
+    """
+
+    if not pages:
+        return
+
+    table = Product.__table__
+    update_query = (
+        update(table)
+        .where(table.c.id == bindparam("product_id"))
+        .values(
+            etag=bindparam("etag"),
+            last_modified=bindparam("last_modified"),
+            fingerprint=bindparam("fingerprint"),
+        )
+    )
+    await session.execute(
+        update_query,
+        [
+            {
+                "product_id": page["product_id"],
+                "etag": page["etag"],
+                "last_modified": page["last_modified"],
+                "fingerprint": page["fingerprint"],
+            }
+            for page in pages
+        ],
+    )
+
+
+async def select_tracked_products(
+    session: AsyncSession,
+    after_id: int,
+    limit: int,
+    product_ids: list[int] = None,
+    slot: tuple[int, int] = None,
+) -> list[TrackedProduct]:
+    """Get a page of products of active subscribers without loading ORM objects
+
+    The page is `limit` products with IDs after `after_id`, so the caller can read
+    all of them page by page without holding a cursor. All tracked products are read
+    if neither the IDs nor the slot are given. The slot is (index, number of slots),
+    a product gets into the slot by its ID.
+    """
+
+    query = (
+        select(
+            Product.id,
+            Product.product_link,
+            Product.current_price,
+            Product.name,
+            Product.etag,
+            Product.last_modified,
+            Product.fingerprint,
+        )
+        # EXISTS, so a product is one row whatever the number of its subscribers
+        .where(Product.id > after_id, Product.users.any(User.is_active))
+        .order_by(Product.id)
+        .limit(limit)
+    )
+    if product_ids is not None:
+        query = query.where(Product.id.in_(product_ids))
+    if slot is not None:
+        index, slots = slot
+        query = query.where(Product.id % slots == index)
+    result = await session.execute(query)
+    return [TrackedProduct(*row) for row in result]
+
+
+async def select_schedule(session: AsyncSession) -> Sequence[Row | RowMapping | Any]:
+    """Get the IDs and the next check times of products having active subscribers"""
+
+    query = select(Product.id, Product.next_check_at).where(
+        Product.users.any(User.is_active)
+    )
+    result = await session.execute(query)
+    return result.all()
+
+
+async def select_refresh_history(
+    session: AsyncSession, product_ids: list[int], since: datetime
+) -> Sequence[Row | RowMapping | Any]:
+    """Get what the refresh schedule of products depends on
+
+    Rows are (product ID, number of active subscribers, number of price changes since the
+    date, time of the last change)
+    """
+
+    subscribers = (
+        select(
+            users_products.c.products_id.label("product_id"),
+            func.count().label("subscribers"),
+        )
+        .join(User, User.id == users_products.c.users_id)
+        .where(users_products.c.products_id.in_(product_ids), User.is_active)
+        .group_by(users_products.c.products_id)
+        .subquery()
+    )
+    history = (
+        select(
+            PricePoint.product_id,
+            func.sum(case((PricePoint.ts >= since, 1), else_=0)).label("changes"),
+            func.max(PricePoint.ts).label("last_change"),
+        )
+        .where(PricePoint.product_id.in_(product_ids))
+        .group_by(PricePoint.product_id)
+        .subquery()
+    )
+    query = (
+        select(
+            Product.id,
+            func.coalesce(subscribers.c.subscribers, 0),
+            func.coalesce(history.c.changes, 0),
+            func.coalesce(history.c.last_change, Product.updated_at),
+        )
+        .outerjoin(subscribers, subscribers.c.product_id == Product.id)
+        .outerjoin(history, history.c.product_id == Product.id)
+        .where(Product.id.in_(product_ids))
+    )
+    result = await session.execute(query)
+    return result.all()
+
+
+async def update_next_checks(session: AsyncSession, schedule: list[dict]) -> None:
+    """Save when products are checked next time
+
+    Each item is a dict with the "product_id" and "next_check_at" keys
+    """
+
+    if not schedule:
+        return
+
+    table = Product.__table__
+    update_query = (
+        update(table)
+        .where(table.c.id == bindparam("product_id"))
+        .values(next_check_at=bindparam("next_check_at"))
+    )
+    await session.execute(update_query, schedule)
+    await session.commit()
+
+
+async def select_last_price_points(
+    session: AsyncSession, product_id: int, limit: int = 10
+) -> Sequence[Row | RowMapping | Any]:
+    """Get the last N price points of the product, the newest first"""
+
+    query = (
+        select(PricePoint.ts, PricePoint.price)
+        .where(PricePoint.product_id == product_id)
+        .order_by(PricePoint.ts.desc())
+        .limit(limit)
+    )
+    result = await session.execute(query)
+    return result.all()
+
+
+async def select_price_points_between(
+    session: AsyncSession, product_id: int, start: datetime, end: datetime
+) -> Sequence[Row | RowMapping | Any]:
+    """Get price points of the product for the period, the oldest first"""
+
+    query = (
+        select(PricePoint.ts, PricePoint.price)
+        .where(
+            PricePoint.product_id == product_id,
+            PricePoint.ts >= start,
+            PricePoint.ts <= end,
+        )
+        .order_by(PricePoint.ts)
+    )
+    result = await session.execute(query)
+    return result.all()
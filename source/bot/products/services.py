@@ -1,5 +1,8 @@
 import os
 import re
+from urllib.parse import urlsplit, urlunsplit
+
+from sqlalchemy.ext.asyncio.session import AsyncSession
 
 from source.bot.products.queries import exist_product, insert_product, remove_product, select_products
 from source.bot.users.queries import add_user_for_product, remove_user_from_special_product
@@ -10,6 +13,18 @@ SERVER_HOST = os.environ.get("SERVER_HOST", "localhost")
 logger = get_logger(__name__)
 
 
+def canonicalize_link(link: str) -> str:
+    """Bring spellings of the product link to one form
+
+    The host is lowercased, the query, the fragment and the trailing slash are dropped
+    """
+
+    parts = urlsplit(link.strip())
+    return urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), "", "")
+    )
+
+
 async def check_link(link: str) -> bool:
     match = re.match(pattern=r"https:\/\/catalog.onliner.by\/.+", string=link)
     logger.info(f"'{link}' is correct")
@@ -17,24 +32,29 @@ async def check_link(link: str) -> bool:
     return True if match else False
 
 
-async def check_product_in_db(username: str, link: str) -> bool:
-    params = {"username": username, "link": link}
-    products = await select_products(params)
+async def check_product_in_db(session: AsyncSession, username: str, link: str) -> bool:
+    params = {"username": username, "link": canonicalize_link(link)}
+    products = await select_products(session=session, params=params)
     return True if products else False
 
 
-async def add_product(username: str, link: str, name: str, price: float) -> int:
-    product_exists = await exist_product(link=link)
+async def add_product(
+    session: AsyncSession, username: str, link: str, name: str, price: float
+) -> int:
+    link = canonicalize_link(link)
+    product_exists = await exist_product(session=session, link=link)
     if product_exists:
-        await add_user_for_product(username=username, link=link)
+        await add_user_for_product(session=session, username=username, link=link)
     else:
-        await insert_product(username=username, link=link, name=name, price=price)
+        await insert_product(
+            session=session, username=username, link=link, name=name, price=price
+        )
     return True
 
 
-async def get_user_products(username: str) -> list[dict]:
+async def get_user_products(session: AsyncSession, username: str) -> list[dict]:
     params = {"username": username}
-    products = await select_products(params)
+    products = await select_products(session=session, params=params)
     product_list = []
     for product in products:
         product_list.append(
@@ -52,19 +72,21 @@ async def get_user_products(username: str) -> list[dict]:
     return product_list
 
 
-async def untrack_product(username: str, product_id: int):
+async def untrack_product(session: AsyncSession, username: str, product_id: int):
     """Untrack a special product"""
 
-    await remove_user_from_special_product(username=username, product_id=product_id)
+    await remove_user_from_special_product(
+        session=session, username=username, product_id=product_id
+    )
     logger.info("Untrack the product")
 
 
-async def check_relationship(product_id: int) -> None:
+async def check_relationship(session: AsyncSession, product_id: int) -> None:
     """Check the relationship of users with products"""
 
     params = {"product_id": product_id}
-    product = await select_products(params)
+    product = await select_products(session=session, params=params)
     product = product[0]
     users = product.users
     if not users:
-        await remove_product(product_id)
+        await remove_product(session=session, product_id=product_id)
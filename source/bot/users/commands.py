@@ -1,27 +1,25 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes, ConversationHandler
 
-from source.bot.config.tools.decorators import log
+from source.bot.config.tools.decorators import log, with_session
 from source.bot.products.callback_data import STATES
 from source.bot.products.commands import start
 from source.bot.users.queries import add_joined_user, select_joined_users
 from source.bot.users.services import delete_joined_user, post_joined_user
-from source.database.engine import create_session
 from source.settings import get_logger
 
 logger = get_logger(__name__)
 
 
 @log(logger)
+@with_session
 async def ask_about_joining(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_data = {
         "username": update.effective_chat.username,
         "chat_id": update.effective_chat.id,
     }
 
-    async_session = await create_session()
-    async with async_session() as session:
-        user_added = await add_joined_user(session=session, data=user_data)
+    user_added = await add_joined_user(session=context.session, data=user_data)
     if user_added:
         await update.message.reply_text("Уведомление отправлено администратору")
     else:
@@ -29,13 +27,12 @@ async def ask_about_joining(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 
 @log(logger)
+@with_session
 async def show_asks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
 
-    async_session = await create_session()
-    async with async_session() as session:
-        joined_users = await select_joined_users(session=session)
+    joined_users = await select_joined_users(session=context.session)
     context.user_data["joined_users"] = {
         f"ask_id={callback_index}": joined_user
         for callback_index, joined_user in enumerate(joined_users)
@@ -88,16 +85,15 @@ async def get_joined_user_actions(update: Update, context: ContextTypes.DEFAULT_
 
 
 @log(logger)
+@with_session
 async def apply_ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     username = context.user_data["joined_user"].username
     chat_id = context.user_data["joined_user"].chat_id
-    async_session = await create_session()
-    async with async_session() as session:
-        error = await post_joined_user(
-            session=session, username=username, chat_id=chat_id
-        )
+    error = await post_joined_user(
+        session=context.session, username=username, chat_id=chat_id
+    )
 
     # Set extra text for next starting menu
     apply_emoji = "\U0001F44D"
@@ -110,7 +106,9 @@ async def apply_ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Delete the user form the JoinedUser table
     joined_user = context.user_data["joined_user"]
-    delete_error = await delete_joined_user(session=session, joined_user=joined_user)
+    delete_error = await delete_joined_user(
+        session=context.session, joined_user=joined_user
+    )
     if delete_error:
         context.user_data["text"] = "Ошибка при удалении пользователя"
         logger.error(delete_error)
@@ -122,13 +120,12 @@ async def apply_ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 @log(logger)
+@with_session
 async def refuse_ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     joined_user = context.user_data["joined_user"]
-    async_session = await create_session()
-    async with async_session() as session:
-        error = await delete_joined_user(session=session, joined_user=joined_user)
+    error = await delete_joined_user(session=context.session, joined_user=joined_user)
 
     # Set extra text for next starting menu
     remove_emoji = "\U0001F534"
@@ -1,81 +1,156 @@
 from typing import Any, Sequence
 
-from sqlalchemy import Row, RowMapping, delete, exists, select
+from sqlalchemy import Row, RowMapping, delete, exists, select, update
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from source.database.engine import create_session
+from source.database.cache import MISSING, TTLCache
 from source.database.models import Product, UnregisteredUser, User
+from source.database.settings import CACHE_MAXSIZE, CACHE_TTL
 
+# Lookups of the "users" table, any change of the table invalidates the whole cache
+users_cache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL)
 
-async def delete_user(username: str) -> None:
+
+async def delete_user(session: AsyncSession, username: str) -> None:
     """Delete user from DB"""
 
-    async_session = await create_session()
-    async with async_session() as session:
-        query = delete(User).where(User.username == username)
-        await session.execute(query)
-        await session.commit()
+    query = delete(User).where(User.username == username)
+    await session.execute(query)
+    await session.commit()
+    users_cache.invalidate()
 
 
 async def select_users(
-    username: str = "", is_admin: bool | None = None, lazy_load: bool = True
+    session: AsyncSession,
+    username: str = "",
+    is_admin: bool | None = None,
+    lazy_load: bool = True,
 ) -> Sequence[Row | RowMapping | Any]:
-    """Get all users"""
+    """Get all users
+
+    The result is cached unless relations are loaded. Cached users are detached
+    from the session, so only their own columns can be read.
+    """
+
+    cache_key = ("select_users", username, is_admin)
+    if lazy_load:
+        users = users_cache.get(cache_key)
+        if users is not MISSING:
+            return users
 
-    async_session = await create_session()
-    async with async_session() as session:
-        query = select(User)
+    query = select(User)
 
-        if username:
-            query = query.where(User.username == username)
-        if is_admin is not None:
-            query = query.where(User.is_admin == is_admin)
-        if not lazy_load:
-            query = query.options(selectinload(User.products), selectinload(User.token))
+    if username:
+        query = query.where(User.username == username)
+    if is_admin is not None:
+        query = query.where(User.is_admin == is_admin)
+    if not lazy_load:
+        query = query.options(selectinload(User.products), selectinload(User.token))
 
-        users = await session.scalars(query)
-        return users.all()
+    users = await session.scalars(query)
+    users = users.all()
 
+    if lazy_load:
+        # Cached objects must not belong to the session of some update
+        for user in users:
+            session.expunge(user)
+        users_cache.set(cache_key, users)
+    return users
 
-async def user_exists(username: str) -> bool:
+
+async def user_exists(session: AsyncSession, username: str) -> bool:
     """Check user in DB"""
 
-    async_session = await create_session()
-    async with async_session() as session:
-        query = select(User).where(User.username == username)
-        user_in_db = await session.scalar(exists(query).select())
-        return user_in_db
+    query = select(User).where(User.username == username)
+    user_in_db = await session.scalar(exists(query).select())
+    return user_in_db
 
 
-async def add_user_for_product(username: str, link: str) -> None:
+async def add_user_for_product(session: AsyncSession, username: str, link: str) -> None:
     """Add user for product tracking"""
 
-    async_session = await create_session()
-    async with async_session() as session:
-        user = await session.scalar(select(User).where(User.username == username))
-        product = await session.scalar(
-            select(Product)
-            .where(Product.product_link == link)
-            .options(selectinload(Product.users))
-        )
-        product.users.append(user)
-        await session.commit()
+    user = await session.scalar(select(User).where(User.username == username))
+    product = await session.scalar(
+        select(Product)
+        .where(Product.product_link == link)
+        .options(selectinload(Product.users))
+    )
+    product.users.append(user)
+    await session.commit()
 
 
-async def remove_user_from_special_product(username: str, product_id: int) -> None:
+async def remove_user_from_special_product(
+    session: AsyncSession, username: str, product_id: int
+) -> None:
     """Delete a special user from product tracking"""
 
-    async_session = await create_session()
-    async with async_session() as session:
-        user = await session.scalar(select(User).where(User.username == username))
-        product = await session.scalar(
-            select(Product)
-            .where(Product.id == product_id)
-            .options(selectinload(Product.users))
+    user = await session.scalar(select(User).where(User.username == username))
+    product = await session.scalar(
+        select(Product)
+        .where(Product.id == product_id)
+        .options(selectinload(Product.users))
+    )
+    product.users.remove(user)
+    await session.commit()
+
+
+async def record_delivery_failures(
+    session: AsyncSession, chat_ids: list[int], max_failures: int
+) -> list[int]:
+    """Count failed deliveries to the chats and deactivate users reaching the max
+
+    Return chat IDs of the deactivated users. Their subscriptions are kept, products
+    tracked only by inactive users just aren't refreshed until a user is back.
+    """
+
+    result = await session.execute(
+        update(User)
+        .where(User.chat_id.in_(chat_ids))
+        .values(failed_deliveries=User.failed_deliveries + 1)
+    )
+    if not result.rowcount:
+        return []
+
+    unreachable = select(User.chat_id).where(
+        User.chat_id.in_(chat_ids),
+        User.is_active,
+        User.failed_deliveries >= max_failures,
+    )
+    deactivated = (await session.scalars(unreachable)).all()
+    if deactivated:
+        await session.execute(
+            update(User).where(User.chat_id.in_(deactivated)).values(is_active=False)
         )
-        product.users.remove(user)
+    await session.commit()
+    users_cache.invalidate()
+    return list(deactivated)
+
+
+async def reset_delivery_failures(session: AsyncSession, chat_ids: list[int]) -> None:
+    """The chats got messages, their failures aren't in a row anymore"""
+
+    result = await session.execute(
+        update(User)
+        .where(User.chat_id.in_(chat_ids), User.failed_deliveries > 0)
+        .values(failed_deliveries=0)
+    )
+    # Most deliveries change nothing, the cache is kept then
+    if result.rowcount:
         await session.commit()
+        users_cache.invalidate()
+
+
+async def activate_user(session: AsyncSession, username: str) -> None:
+    """The user is back, notifications go to them again"""
+
+    await session.execute(
+        update(User)
+        .where(User.username == username)
+        .values(is_active=True, failed_deliveries=0)
+    )
+    await session.commit()
+    users_cache.invalidate()
 
 
 async def insert_joined_user(
@@ -90,6 +165,7 @@ async def insert_joined_user(
         return ex
 
     await session.commit()
+    users_cache.invalidate()
 
 
 async def remove_joined_user(
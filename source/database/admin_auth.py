@@ -10,6 +10,7 @@ from sqlalchemy.ext.asyncio.engine import AsyncEngine
 
 from source.bot.users.queries import select_users
 from source.database.admin_dashboard import ProductAdmin, SessionTokenAdmin, UserAdmin
+from source.database.engine import create_session
 from source.database.services import send_notification_to_admin
 from source.database.session_tokens.services import add_token_for_user, check_token_in_db, remove_token_for_user
 from source.settings import ADMIN_PASSWORD, get_logger
@@ -28,7 +29,9 @@ class AdminAuth(AuthenticationBackend):
         form = await request.form()
         username, password = form["username"], form["password"]
 
-        admin_users = await select_users(is_admin=True)
+        async_session = await create_session()
+        async with async_session() as session:
+            admin_users = await select_users(session=session, is_admin=True)
 
         if admin_users:
             user = admin_users[0]
@@ -1,6 +1,10 @@
+from typing import Any
+
 from sqladmin import ModelView
 
+from source.bot.users.queries import users_cache
 from source.database.models import Product, SessionToken, User
+from source.database.session_tokens.services import tokens_cache
 
 
 class UserAdmin(ModelView, model=User):
@@ -32,6 +36,15 @@ class UserAdmin(ModelView, model=User):
     can_delete = True
     can_view_details = True
 
+    # Cached users must not outlive the edits
+    async def after_model_change(
+        self, data: dict, model: Any, is_created: bool
+    ) -> None:
+        users_cache.invalidate()
+
+    async def after_model_delete(self, model: Any) -> None:
+        users_cache.invalidate()
+
 
 class ProductAdmin(ModelView, model=Product):
     # Columns
@@ -82,3 +95,7 @@ class SessionTokenAdmin(ModelView, model=SessionToken):
     can_edit = False
     can_delete = True
     can_view_details = True
+
+    # The deleted token must log out the dashboard session at once
+    async def after_model_delete(self, model: Any) -> None:
+        tokens_cache.invalidate(model.token)
@@ -0,0 +1,51 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+# The marker of a missing entry, since None is a valid cached value
+MISSING = object()
+
+
+class TTLCache:
+    """A bounded LRU cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any:
+        """Get the value or MISSING, the result is counted as a hit or a miss"""
+
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self._data.pop(key, None)
+            self.misses += 1
+            return MISSING
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable = MISSING) -> None:
+        """Drop the entry or all entries if the key isn't passed"""
+
+        if key is MISSING:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
@@ -1,20 +1,165 @@
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import URL, event, inspect, make_url
+from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.asyncio.engine import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 
-from source.database.models import Base
-from source.database.settings import DB_ECHO, DB_URL
+from source.database.settings import (
+    ALEMBIC_CONFIG,
+    DB_APPLICATION_NAME,
+    DB_COMMAND_TIMEOUT,
+    DB_ECHO,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE,
+    DB_STATEMENT_TIMEOUT,
+    DB_URL,
+    SQLITE_PRAGMAS,
+)
+from source.settings import get_logger
 
+logger = get_logger(__name__)
 
-async def get_engine() -> AsyncEngine:
-    engine = create_async_engine(url=DB_URL, echo=DB_ECHO)
+# The first revision matches the tables made by the former "create_all" call
+INITIAL_REVISION = "0001"
+
+# The engine and the session factory live as long as the application
+engine: AsyncEngine | None = None
+async_session: async_sessionmaker | None = None
+
+
+def is_sqlite_file(url: URL) -> bool:
+    in_memory = url.database in (None, "", ":memory:")
+    return url.get_backend_name() == "sqlite" and not in_memory
+
+
+def get_engine_options(url: URL) -> dict:
+    """Get the engine options suitable for the database backend"""
+
+    options = {"echo": DB_ECHO}
+
+    if url.get_backend_name() == "sqlite":
+        if not is_sqlite_file(url):
+            # All sessions have to share the only connection to the memory DB
+            options["poolclass"] = StaticPool
+            return options
+        # aiosqlite uses NullPool for files, so every checkout would reconnect
+        options["poolclass"] = AsyncAdaptedQueuePool
+
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+
+    if url.get_driver_name() == "asyncpg":
+        options["connect_args"] = {
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "command_timeout": DB_COMMAND_TIMEOUT,
+            "server_settings": {
+                "application_name": DB_APPLICATION_NAME,
+                "statement_timeout": str(DB_STATEMENT_TIMEOUT),
+                # Short OLTP queries don't win anything from JIT compilation
+                "jit": "off",
+            },
+        }
+    return options
+
+
+def set_sqlite_pragmas(engine: AsyncEngine, pragmas: dict = SQLITE_PRAGMAS) -> None:
+    """Apply the PRAGMA profile to every new SQLite connection of the engine"""
+
+    pragmas = {name: value for name, value in pragmas.items() if value}
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, _) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def init_engine(url: str = DB_URL) -> AsyncEngine:
+    """Create the engine and the session factory for the whole application"""
+
+    global engine, async_session
+
+    if engine is None:
+        url = make_url(url)
+        engine = create_async_engine(url, **get_engine_options(url))
+        if is_sqlite_file(url):
+            set_sqlite_pragmas(engine)
+        logger.info(f"Connect to the '{url.get_backend_name()}' database")
+        async_session = async_sessionmaker(engine, expire_on_commit=False)
     return engine
 
 
-async def create_session() -> async_sessionmaker:
+async def dispose_engine() -> None:
+    """Close all pooled connections on shutdown"""
+
+    global engine, async_session
+
+    if engine is not None:
+        await engine.dispose()
+    engine = None
+    async_session = None
+
+
+async def checkpoint() -> None:
+    """Move the SQLite write-ahead log into the database file"""
+
     engine = await get_engine()
-    async_session = async_sessionmaker(engine, expire_on_commit=False)
+    if is_sqlite_file(engine.url):
+        async with engine.connect() as conn:
+            await conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+async def reset_connections() -> None:
+    """Close pooled connections, e.g. before the database file is replaced
+
+    The log is checkpointed and truncated first, so nothing of the old file is left
+    in it to be applied to the new one. The -wal and -shm files belong to SQLite,
+    connections still checked out may use them.
+    """
+
+    await checkpoint()
+    engine = await get_engine()
+    await engine.dispose()
+
+
+async def get_engine() -> AsyncEngine:
+    return init_engine()
 
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
 
+async def create_session() -> async_sessionmaker:
+    await get_engine()
     return async_session
+
+
+def _upgrade(connection: Connection) -> None:
+    config = Config(ALEMBIC_CONFIG)
+    config.attributes["connection"] = connection
+
+    inspector = inspect(connection)
+    if not inspector.has_table("alembic_version") and inspector.has_table("users"):
+        # The database was created before migrations were introduced
+        logger.info(f"Stamp the existing database with revision {INITIAL_REVISION}")
+        command.stamp(config, INITIAL_REVISION)
+
+    command.upgrade(config, "head")
+
+
+async def migrate() -> None:
+    """Upgrade the database schema to the latest revision"""
+
+    engine = await get_engine()
+    async with engine.begin() as conn:
+        await conn.run_sync(_upgrade)
+    logger.info("The database schema is up to date")
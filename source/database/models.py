@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import List
 
-from sqlalchemy import Column, ForeignKey, Table
+from sqlalchemy import BigInteger, Boolean, Column, Float, ForeignKey, Table, Text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -18,6 +18,11 @@ users_products = Table(
     metadata,
     Column("users_id", ForeignKey("users.id"), primary_key=True),
     Column("products_id", ForeignKey("products.id"), primary_key=True),
+    # Alert rules of the subscription, a rule is off when it's NULL
+    Column("alert_abs_delta", Float, nullable=True, default=1),  # BYN
+    Column("alert_pct_delta", Float, nullable=True),  # % of the previous price
+    Column("target_price", Float, nullable=True),
+    Column("notify_in_stock", Boolean, nullable=False, default=False),
 )
 
 
@@ -26,8 +31,12 @@ class User(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     username: Mapped[str] = mapped_column(unique=True, nullable=True)
-    chat_id: Mapped[int] = mapped_column(unique=True, nullable=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, unique=True, nullable=True)
     is_admin: Mapped[bool] = mapped_column(default=False)
+    # Notifications that failed for good in a row (the bot is blocked and so on),
+    # after some of them the user is inactive and gets nothing
+    failed_deliveries: Mapped[int] = mapped_column(default=0)
+    is_active: Mapped[bool] = mapped_column(default=True)
 
     # Relations
     token: Mapped[SessionToken] = relationship(
@@ -50,6 +59,12 @@ class Product(Base):
     current_price: Mapped[float] = mapped_column(default=0)
     previous_price: Mapped[float] = mapped_column(default=0)
     updated_at: Mapped[datetime] = mapped_column(nullable=True)
+    # The page state of the last parse, unchanged pages aren't parsed again
+    etag: Mapped[str] = mapped_column(nullable=True)
+    last_modified: Mapped[str] = mapped_column(nullable=True)
+    fingerprint: Mapped[str] = mapped_column(nullable=True)
+    # When the adaptive scheduler checks the product again
+    next_check_at: Mapped[datetime] = mapped_column(nullable=True)
 
     # Relations
     users: Mapped[List[User]] = relationship(
@@ -60,6 +75,42 @@ class Product(Base):
         return f"Product '{self.name}'"
 
 
+class PricePoint(Base):
+    """The price history, a row appears only when the price changes"""
+
+    __tablename__ = "price_points"
+    # The primary key is the only index: it serves "last N points" and date ranges
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    product_id: Mapped[int] = mapped_column(
+        ForeignKey("products.id", ondelete="CASCADE"), primary_key=True
+    )
+    ts: Mapped[datetime] = mapped_column(primary_key=True)
+    price: Mapped[float]
+
+    def __str__(self):
+        return f"PricePoint '{self.product_id}' ({self.ts})"
+
+
+class Notification(Base):
+    """The outbox of messages, rows are written with price changes and sent later"""
+
+    __tablename__ = "notifications"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    text: Mapped[str] = mapped_column(Text)
+    # "pending", "delivered" or "failed"
+    status: Mapped[str] = mapped_column(default="pending", index=True)
+    attempts: Mapped[int] = mapped_column(default=0)
+    created_at: Mapped[datetime]
+    next_attempt_at: Mapped[datetime] = mapped_column(nullable=True)
+    delivered_at: Mapped[datetime] = mapped_column(nullable=True)
+
+    def __str__(self):
+        return f"Notification '{self.id}' ({self.status})"
+
+
 class SessionToken(Base):
     __tablename__ = "session_tokens"
 
@@ -79,7 +130,7 @@ class UnregisteredUser(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True)
     username: Mapped[str] = mapped_column(unique=True, nullable=True)
-    chat_id: Mapped[int] = mapped_column(unique=True, nullable=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, unique=True, nullable=True)
 
     def __str__(self):
         return f"JoinUser '{self.username}'"
@@ -1,14 +1,38 @@
+from source.database.cache import MISSING, TTLCache
+from source.database.engine import create_session
 from source.database.session_tokens.queries import exist_token, insert_token, remove_token
+from source.database.settings import CACHE_MAXSIZE, TOKEN_CACHE_TTL, TOKEN_NEGATIVE_CACHE_TTL
+
+# Results of token checks, unknown tokens are cached for a shorter time
+tokens_cache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=TOKEN_CACHE_TTL)
 
 
 async def add_token_for_user(token: str, username: str) -> None:
-    await insert_token(token, username)
+    async_session = await create_session()
+    async with async_session() as session:
+        await insert_token(session=session, token=token, username=username)
+    tokens_cache.set(token, True)
 
 
 async def remove_token_for_user(token: str) -> None:
-    await remove_token(token)
+    async_session = await create_session()
+    async with async_session() as session:
+        await remove_token(session=session, token=token)
+    tokens_cache.invalidate(token)
 
 
 async def check_token_in_db(token: str) -> bool:
-    it_exists = await exist_token(token)
+    if not token:
+        return False
+
+    it_exists = tokens_cache.get(token)
+    if it_exists is not MISSING:
+        return it_exists
+
+    async_session = await create_session()
+    async with async_session() as session:
+        it_exists = await exist_token(session=session, token=token)
+
+    ttl = None if it_exists else TOKEN_NEGATIVE_CACHE_TTL
+    tokens_cache.set(token, it_exists, ttl=ttl)
     return it_exists
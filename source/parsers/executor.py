@@ -0,0 +1,53 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from source.parsers.settings import PARSE_EXECUTOR, PARSE_WORKERS
+from source.settings import get_logger
+
+logger = get_logger(__name__)
+
+# The pool for CPU-bound parsing, None means parsing in the event loop
+executor: Executor | None = None
+
+MODES = ("loop", "thread", "process")
+
+
+def init_executor(mode: str = PARSE_EXECUTOR, workers: int = PARSE_WORKERS) -> None:
+    """Create the pool for parsing pages"""
+
+    global executor
+
+    if mode not in MODES:
+        raise ValueError(f"Unknown parse executor '{mode}', expected one of {MODES}")
+    if executor is not None:
+        return
+    if mode == "process":
+        # "spawn" doesn't copy threads of the running application into workers
+        executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    elif mode == "thread":
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="parser")
+    logger.info(f"Pages are parsed in the '{mode}' mode")
+
+
+def shutdown_executor() -> None:
+    global executor
+
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+    executor = None
+
+
+async def run(function: Callable, *args) -> Any:
+    """Call the function in the pool if there is one
+
+    The function and its arguments have to be picklable for the process pool
+    """
+
+    if executor is None:
+        return function(*args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, function, *args)
@@ -0,0 +1,266 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+from urllib.parse import urlsplit
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
+
+from source.parsers.settings import (
+    BREAKER_COOLDOWN,
+    BREAKER_THRESHOLD,
+    FETCH_BURST,
+    FETCH_CONCURRENCY,
+    FETCH_PER_HOST,
+    FETCH_RATE_PER_HOST,
+    FETCH_RETRIES,
+    FETCH_RETRY_BASE_DELAY,
+    FETCH_RETRY_MAX_DELAY,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_LIMIT,
+    HTTP_LIMIT_PER_HOST,
+    HTTP_READ_TIMEOUT,
+    HTTP_TOTAL_TIMEOUT,
+    HTTP_USER_AGENT,
+)
+from source.settings import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+# The HTTP client lives as long as the application
+client: ClientSession | None = None
+
+
+class RetryableError(Exception):
+    """The server is overloaded or failed (429 or 5xx), the request can be repeated"""
+
+    def __init__(self, status: int, retry_after: float | None = None) -> None:
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class HostUnavailable(Exception):
+    """The circuit breaker of the host is open"""
+
+
+def init_client() -> ClientSession:
+    """Create the HTTP client shared by the whole application"""
+
+    global client
+
+    if client is None or client.closed:
+        connector = TCPConnector(
+            limit=HTTP_LIMIT,
+            limit_per_host=HTTP_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        )
+        timeout = ClientTimeout(
+            total=HTTP_TOTAL_TIMEOUT,
+            connect=HTTP_CONNECT_TIMEOUT,
+            sock_read=HTTP_READ_TIMEOUT,
+        )
+        client = ClientSession(
+            connector=connector,
+            timeout=timeout,
+            headers={"User-Agent": HTTP_USER_AGENT},
+        )
+    return client
+
+
+async def close_client() -> None:
+    """Close pooled connections on shutdown"""
+
+    global client
+
+    if client is not None:
+        await client.close()
+    client = None
+
+
+def get_client() -> ClientSession:
+    return init_client()
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds from the Retry-After header, it's either seconds or an HTTP date"""
+
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+def get_retry_delay(attempt: int, retry_after: float | None = None) -> float:
+    """Exponential backoff with the full jitter, the server's Retry-After wins"""
+
+    if retry_after is not None:
+        return min(retry_after, FETCH_RETRY_MAX_DELAY)
+    return random.uniform(
+        0, min(FETCH_RETRY_MAX_DELAY, FETCH_RETRY_BASE_DELAY * 2**attempt)
+    )
+
+
+class TokenBucket:
+    """Allow `rate` requests per second on average and `burst` requests at once"""
+
+    def __init__(self, rate: float = FETCH_RATE_PER_HOST, burst: int = FETCH_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def take(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """Stop requests to a host after failed requests in a row
+
+    The circuit is closed while requests succeed and opens after `threshold`
+    failures. When the cooldown passes it's half-open: one probe request goes, its
+    success closes the circuit and its failure opens it for another cooldown.
+    """
+
+    def __init__(
+        self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN
+    ) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.probing or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def release(self) -> None:
+        """The request ended with neither a success nor a failure of the host"""
+
+        self.probing = False
+
+
+class HostLimiter:
+    """Limit concurrent requests globally and for each host, and the request rate
+    of each host"""
+
+    def __init__(
+        self, concurrency: int = FETCH_CONCURRENCY, per_host: int = FETCH_PER_HOST
+    ) -> None:
+        self.per_host = per_host
+        self._global = asyncio.Semaphore(concurrency)
+        self._hosts: dict[str, asyncio.Semaphore] = {}
+        self._buckets: dict[str, TokenBucket] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        return self._breakers.setdefault(host, CircuitBreaker())
+
+    @asynccontextmanager
+    async def acquire(self, url: str) -> AsyncIterator[None]:
+        host = urlsplit(url).netloc
+        semaphore = self._hosts.setdefault(host, asyncio.Semaphore(self.per_host))
+        bucket = self._buckets.setdefault(host, TokenBucket())
+        async with semaphore, self._global:
+            await bucket.take()
+            yield
+
+
+# Limits of hosts are shared by all refresh cycles
+limiter: HostLimiter | None = None
+
+
+def get_limiter() -> HostLimiter:
+    global limiter
+
+    if limiter is None:
+        limiter = HostLimiter()
+    return limiter
+
+
+async def request(
+    url: str, call: Callable[[], Awaitable[T]], retries: int = None
+) -> T:
+    """Make the request to the URL within the limits of its host
+
+    429, 5xx and network errors are retried with backoff, FETCH_RETRIES times by
+    default. A request that fails after
+    all the retries counts as one failure of the host, failures in a row open the
+    circuit breaker of the host, then requests fail with `HostUnavailable` at once.
+    """
+
+    if retries is None:
+        retries = FETCH_RETRIES
+    host_limiter = get_limiter()
+    breaker = host_limiter.breaker(url)
+    if not breaker.allow_request():
+        raise HostUnavailable(urlsplit(url).netloc)
+
+    try:
+        for attempt in range(retries + 1):
+            try:
+                async with host_limiter.acquire(url):
+                    result = await call()
+            except (RetryableError, ClientError, asyncio.TimeoutError) as ex:
+                if attempt == retries:
+                    breaker.record_failure()
+                    raise
+                delay = get_retry_delay(attempt, getattr(ex, "retry_after", None))
+                logger.warning(f"Retry {url} in {delay:.1f}s ({ex!r})")
+                await asyncio.sleep(delay)
+            else:
+                breaker.record_success()
+                return result
+    finally:
+        # E.g. the parser failed or the cycle is cancelled during the probe
+        breaker.release()
@@ -1,36 +1,266 @@
+import codecs
+import hashlib
 import os
+import re
+from html import unescape
+from typing import NamedTuple
 
 from aiohttp import ClientSession
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
+from source.parsers import executor
+from source.parsers.http import RetryableError, parse_retry_after, request
+from source.parsers.settings import FETCH_CHUNK_SIZE, FETCH_STREAMING, PARSER_BACKEND
 from source.settings import get_logger
 
+try:
+    from lxml import html as lxml_html
+except ImportError:  # lxml is optional
+    lxml_html = None
+
 logger = get_logger(__name__)
 
 SERVER_HOST = os.environ.get("SERVER_HOST", "localhost")
 
+NAME_CLASS = "catalog-masthead__title js-nav-header"
+PRICE_CLASS = "offers-description__link offers-description__link_nodecor js-description-price-link"
 
-async def parse(session: ClientSession, url: str) -> tuple | None:
-    async with session.get(url) as resp:
-        text = await resp.text()
-        soup = BeautifulSoup(text, "html.parser")
-        name = soup.find("h1", class_="catalog-masthead__title js-nav-header")
-        if not name:
-            return None, None
-        name = name.string.strip()
-        price = soup.find(
-            "a",
-            class_="offers-description__link offers-description__link_nodecor js-description-price-link",
-        )
+NAME_PATTERN = re.compile(
+    rf"<h1\b[^>]*\bclass=\"{re.escape(NAME_CLASS)}\"[^>]*>(.*?)</h1>", re.S
+)
+PRICE_PATTERN = re.compile(
+    rf"<a\b[^>]*\bclass=\"{re.escape(PRICE_CLASS)}\"[^>]*>(.*?)</a>", re.S
+)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+# Only these tags get into the tree of the "strainer" backend
+STRAINER = SoupStrainer(["h1", "a"], class_=[NAME_CLASS, PRICE_CLASS])
+
+
+class Page(NamedTuple):
+    """The downloaded page and its validators for the next conditional request"""
+
+    text: str | None  # None if the page isn't modified
+    etag: str | None
+    last_modified: str | None
+    size: int = 0  # bytes read
+    saved: int = 0  # bytes not read, if the length of the body is known
+    partial: bool = False  # the download stopped after the price
+
+
+class PageScanner:
+    """Look for the name and the price tags while the page is downloaded by chunks"""
+
+    def __init__(self) -> None:
+        self.text = ""
+        self._name_end = None
+
+    def _search(self, pattern: re.Pattern, opening: str, pos: int, checked: int):
+        # A tag may start in the text checked before and end in the new chunk
+        start = self.text.rfind(opening, pos, checked)
+        if start == -1:
+            start = checked - len(opening)
+        return pattern.search(self.text, max(pos, start))
+
+    def feed(self, chunk: str) -> bool:
+        """Add the next chunk, True means both tags are found"""
+
+        checked = len(self.text)
+        self.text += chunk
+        if self._name_end is None:
+            name = self._search(NAME_PATTERN, "<h1", 0, checked)
+            if not name:
+                return False
+            self._name_end = name.end()
+            return PRICE_PATTERN.search(self.text, self._name_end) is not None
+        return self._search(PRICE_PATTERN, "<a", self._name_end, checked) is not None
+
+
+async def fetch_page(
+    session: ClientSession,
+    url: str,
+    etag: str = None,
+    last_modified: str = None,
+    stream: bool = FETCH_STREAMING,
+) -> Page:
+    """Download the product page if it's modified since the last request
 
-        if not price:  # Price = "Нет в наличии или под заказ"
-            price = 0.0
-        else:
-            price = float(
-                "".join(
-                    n.replace(",", ".") if n.isdigit() or n == "," else ""
-                    for n in price.string
-                )
+    In the streaming mode the download stops as soon as the name and the price are
+    received, they are near the top of the page
+    """
+
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    async with session.get(url, headers=headers) as resp:
+        if resp.status == 304:
+            return Page(None, etag, last_modified)
+        if resp.status == 429 or resp.status >= 500:
+            raise RetryableError(
+                resp.status, parse_retry_after(resp.headers.get("Retry-After"))
+            )
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+
+        if not stream:
+            body = await resp.read()
+            return Page(
+                body.decode(resp.get_encoding()), etag, last_modified, len(body)
             )
+
+        try:
+            encoding = resp.get_encoding()
+        except RuntimeError:  # No charset in the headers
+            encoding = "utf-8"
+        decoder = codecs.getincrementaldecoder(encoding)()
+        scanner = PageScanner()
+        size = 0
+        async for chunk in resp.content.iter_chunked(FETCH_CHUNK_SIZE):
+            size += len(chunk)
+            if scanner.feed(decoder.decode(chunk)) and not resp.content.at_eof():
+                # The rest of the body isn't needed, the connection can't be reused
+                resp.close()
+                saved = 0
+                # The length of a compressed body can't be compared with read bytes
+                if resp.content_length and "Content-Encoding" not in resp.headers:
+                    saved = resp.content_length - size
+                return Page(scanner.text, etag, last_modified, size, saved, True)
+        scanner.feed(decoder.decode(b"", final=True))
+        return Page(scanner.text, etag, last_modified, size)
+
+
+def to_price(text: str) -> float:
+    """Convert the price text like '1 234,56 р.' to the number"""
+
+    return float(
+        "".join(n.replace(",", ".") if n.isdigit() or n == "," else "" for n in text)
+    )
+
+
+def extract_soup(text: str) -> tuple:
+    """Get the product name and price from the full DOM of the page"""
+
+    soup = BeautifulSoup(text, "html.parser")
+    name = soup.find("h1", class_=NAME_CLASS)
+    if not name:
+        return None, None
+    name = name.get_text().strip()
+    price = soup.find("a", class_=PRICE_CLASS)
+
+    if not price:  # Price = "Нет в наличии или под заказ"
+        price = 0.0
+    else:
+        price = to_price(price.get_text())
+    return name, price
+
+
+def extract_strainer(text: str) -> tuple | None:
+    """Build the tree only of the name and the price tags"""
+
+    soup = BeautifulSoup(text, "html.parser", parse_only=STRAINER)
+    name = soup.find("h1", class_=NAME_CLASS)
+    price = soup.find("a", class_=PRICE_CLASS)
+    if not name or not price:
+        return None
+    return name.get_text().strip(), to_price(price.get_text())
+
+
+def extract_regex(text: str) -> tuple | None:
+    """Find the name and the price tags by their classes without parsing"""
+
+    name = NAME_PATTERN.search(text)
+    if not name:
+        return None
+    price = PRICE_PATTERN.search(text, name.end())
+    if not price:
+        return None
+    name = unescape(TAG_PATTERN.sub("", name.group(1))).strip()
+    return name, to_price(TAG_PATTERN.sub("", price.group(1)))
+
+
+def extract_lxml(text: str) -> tuple | None:
+    """Use the C parser of lxml"""
+
+    tree = lxml_html.fromstring(text)
+    name = tree.xpath(f'//h1[@class="{NAME_CLASS}"]')
+    price = tree.xpath(f'//a[@class="{PRICE_CLASS}"]')
+    if not name or not price:
+        return None
+    return name[0].text_content().strip(), to_price(price[0].text_content())
+
+
+BACKENDS = {
+    "regex": extract_regex,
+    "strainer": extract_strainer,
+    "lxml": extract_lxml,
+    "soup": extract_soup,
+}
+
+
+def get_backend(name: str = PARSER_BACKEND):
+    if name == "lxml" and lxml_html is None:
+        logger.warning("lxml isn't installed, the 'strainer' parser is used")
+        name = "strainer"
+    return BACKENDS[name]
+
+
+extract_fast = get_backend()
+
+
+def extract(text: str) -> tuple:
+    """Get the product name and price from the page
+
+    The fast backend gives up if any tag isn't found, e.g. the product is out of stock.
+    Then the full DOM parser decides.
+    """
+
+    if extract_fast is not extract_soup:
+        result = extract_fast(text)
+        if result is not None:
+            return result
+    return extract_soup(text)
+
+
+def get_fingerprint(text: str) -> str | None:
+    """Hash the page region from the name to the price
+
+    The rest of the page (ads, reviews, other offers) changes too often to be hashed
+    """
+
+    name = NAME_PATTERN.search(text)
+    if not name:
+        return None
+    price = PRICE_PATTERN.search(text, name.end())
+    end = price.end() if price else name.end()
+    return hashlib.blake2b(
+        text[name.start():end].encode(), digest_size=16
+    ).hexdigest()
+
+
+def extract_changed(text: str, fingerprint: str = None) -> tuple:
+    """Get the fingerprint of the page and its name and price
+
+    The name and price are None if the fingerprint is the same as the given one
+    """
+
+    new_fingerprint = get_fingerprint(text)
+    if new_fingerprint is not None and new_fingerprint == fingerprint:
+        return new_fingerprint, None
+    return new_fingerprint, extract(text)
+
+
+async def parse(session: ClientSession, url: str, retries: int = None) -> tuple | None:
+    page = await request(url, lambda: fetch_page(session, url), retries)
+    name, price = await executor.run(extract, page.text)
+    if name is None and page.partial:
+        # Read the whole page if the cut one confuses the parser
+        page = await request(
+            url, lambda: fetch_page(session, url, stream=False), retries
+        )
+        name, price = await executor.run(extract, page.text)
+    if name:
         logger.info(f"Product name and price are received('{name}', {url})")
-        return name, price
+    return name, price
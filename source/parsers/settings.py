@@ -0,0 +1,44 @@
+import os
+
+# Max number of product pages downloaded at the same time
+FETCH_CONCURRENCY = int(os.environ.get("FETCH_CONCURRENCY", 10))
+# Max number of simultaneous requests to one host
+FETCH_PER_HOST = int(os.environ.get("FETCH_PER_HOST", 5))
+
+# Shared HTTP client
+HTTP_LIMIT = int(os.environ.get("HTTP_LIMIT", 100))  # open connections
+HTTP_LIMIT_PER_HOST = int(os.environ.get("HTTP_LIMIT_PER_HOST", 10))
+HTTP_KEEPALIVE_TIMEOUT = int(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", 30))  # seconds
+HTTP_DNS_CACHE_TTL = int(os.environ.get("HTTP_DNS_CACHE_TTL", 300))  # seconds
+HTTP_TOTAL_TIMEOUT = int(os.environ.get("HTTP_TOTAL_TIMEOUT", 30))  # seconds
+HTTP_CONNECT_TIMEOUT = int(os.environ.get("HTTP_CONNECT_TIMEOUT", 10))  # seconds
+HTTP_READ_TIMEOUT = int(os.environ.get("HTTP_READ_TIMEOUT", 15))  # seconds
+HTTP_USER_AGENT = os.environ.get(
+    "HTTP_USER_AGENT",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/118.0 Safari/537.36",
+)
+
+# Fast parser of product pages: "regex", "strainer", "lxml" (if installed) or "soup".
+# The full DOM parser ("soup") is the fallback of the others
+PARSER_BACKEND = os.environ.get("PARSER_BACKEND", "regex")
+
+# Where pages are parsed: "loop" (in the event loop), "thread" or "process" pool.
+# The process pool starts PARSE_WORKERS interpreters, it pays off on large catalogs
+PARSE_EXECUTOR = os.environ.get("PARSE_EXECUTOR", "thread")
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", min(4, os.cpu_count() or 1)))
+
+# Read product pages by chunks and stop after the name and the price
+FETCH_STREAMING = os.environ.get("FETCH_STREAMING", "True") == "True"
+FETCH_CHUNK_SIZE = int(os.environ.get("FETCH_CHUNK_SIZE", 16384))  # bytes
+
+# Requests per second to one host and the burst allowed after a pause
+FETCH_RATE_PER_HOST = float(os.environ.get("FETCH_RATE_PER_HOST", 5))
+FETCH_BURST = int(os.environ.get("FETCH_BURST", 10))
+# Retries of 429, 5xx and network errors with the exponential backoff
+FETCH_RETRIES = int(os.environ.get("FETCH_RETRIES", 3))
+FETCH_RETRY_BASE_DELAY = float(os.environ.get("FETCH_RETRY_BASE_DELAY", 1))  # seconds
+FETCH_RETRY_MAX_DELAY = float(os.environ.get("FETCH_RETRY_MAX_DELAY", 60))  # seconds
+# A host is paused after N requests in a row failed with all their retries
+BREAKER_THRESHOLD = int(os.environ.get("BREAKER_THRESHOLD", 5))
+BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", 60))  # seconds
@@ -4,8 +4,11 @@ from fastapi.responses import Response
 from telegram import Update
 from telegram.ext import Application
 
+from source.bot.config.tools.monitoring import loop_lag
+from source.bot.users.queries import users_cache
 from source.database.admin_auth import get_admin_dashboard
 from source.database.engine import get_engine
+from source.database.session_tokens.services import tokens_cache
 from source.settings import get_logger
 from source.webserver.settings import Settings
 
@@ -23,6 +26,14 @@ async def create_app(bot_app: Application) -> FastAPI:
     async def index():
         return {"message": "Bot is running"}
 
+    @web_app.get("/stats")
+    async def stats():
+        return {
+            "users_cache": users_cache.stats(),
+            "tokens_cache": tokens_cache.stats(),
+            "loop_lag": loop_lag.stats(),
+        }
+
     @web_app.post("/telegram")
     async def telegram(request: Request):
         try:
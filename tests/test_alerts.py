@@ -0,0 +1,115 @@
+import asyncio
+
+from sqlalchemy import insert
+
+from source.bot.products.queries import select_alerts, update_prices
+from source.database import engine as db
+from source.database.models import Product, User, users_products
+
+# Product ID: (the price before, the price after)
+PRICES = {
+    1: (10.2, 9.2),
+    2: (0, 50),
+    3: (100, 80),
+    4: (100, 95),
+    5: (100, 99.5),
+    6: (100, 50),
+}
+
+# (user ID, product ID, absolute delta, percent delta, target price, in stock)
+RULES = [
+    # The delta is rounded, 10.2 - 9.2 isn't 0.99...
+    (1, 1, 1, None, None, False),
+    # "in_stock" goes before "target"
+    (1, 2, 1, None, 60, True),
+    # "target" goes before "percent" and "delta"
+    (1, 3, 1, 10, 90, False),
+    # "percent" goes before "delta"
+    (1, 4, 1, 5, None, False),
+    # Nothing is triggered
+    (1, 5, 1, None, None, False),
+    # All rules are off
+    (1, 6, None, None, None, False),
+    # Another subscriber of the same product gets its own rule
+    (2, 3, 100, None, None, False),
+    (2, 4, 5, None, None, False),
+    # An inactive user gets nothing
+    (3, 1, 1, None, None, False),
+]
+
+
+async def seed() -> None:
+    session_maker = await db.create_session()
+    async with session_maker() as session:
+        session.add_all(
+            [
+                User(id=1, username="first", chat_id=101),
+                User(id=2, username="second", chat_id=102),
+                User(id=3, username="inactive", chat_id=103, is_active=False),
+            ]
+        )
+        session.add_all(
+            [
+                Product(
+                    id=product_id,
+                    product_link=f"https://catalog.onliner.by/{product_id}",
+                    current_price=before,
+                )
+                for product_id, (before, _) in PRICES.items()
+            ]
+        )
+        await session.flush()
+        await session.execute(
+            insert(users_products),
+            [
+                {
+                    "users_id": user_id,
+                    "products_id": product_id,
+                    "alert_abs_delta": abs_delta,
+                    "alert_pct_delta": pct_delta,
+                    "target_price": target,
+                    "notify_in_stock": in_stock,
+                }
+                for user_id, product_id, abs_delta, pct_delta, target, in_stock in RULES
+            ],
+        )
+        await session.commit()
+
+
+async def evaluate() -> set[tuple]:
+    session_maker = await db.create_session()
+    async with session_maker() as session:
+        await update_prices(
+            session=session,
+            changes=[
+                {"product_id": product_id, "price": after}
+                for product_id, (_, after) in PRICES.items()
+            ],
+        )
+        rows = await select_alerts(session=session, product_ids=list(PRICES))
+        await session.commit()
+    return {tuple(row) for row in rows}
+
+
+def test_select_alerts(database):
+    asyncio.run(db.migrate())
+    asyncio.run(seed())
+
+    assert asyncio.run(evaluate()) == {
+        (101, 1, "delta"),
+        (101, 2, "in_stock"),
+        (101, 3, "target"),
+        (101, 4, "percent"),
+        (102, 4, "delta"),
+    }
+
+
+def test_select_alerts_without_products(database):
+    asyncio.run(db.migrate())
+
+    async def main() -> list:
+        session_maker = await db.create_session()
+        async with session_maker() as session:
+            return list(await select_alerts(session=session, product_ids=[]))
+
+    assert asyncio.run(main()) == []
@@ -0,0 +1,221 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from aiohttp import ClientSession, ClientTimeout, web
+
+from source.parsers import http
+from source.parsers.http import CircuitBreaker, HostUnavailable, RetryableError, get_retry_delay, request
+from source.parsers.onliner import Page, fetch_page
+
+import pytest
+
+PAGE = (
+    '<h1 class="catalog-masthead__title js-nav-header">Phone</h1>'
+    '<a class="offers-description__link offers-description__link_nodecor '
+    'js-description-price-link">100,50 р.</a>'
+)
+
+
+class FakeServer:
+    """A product page behind the given answers, one answer per request
+
+    An answer is a status with headers or a delay in seconds before the page.
+    The page is served when the answers run out.
+    """
+
+    def __init__(self, answers: list) -> None:
+        self.answers = list(answers)
+        self.hits = 0
+
+    async def handle(self, _: web.Request) -> web.Response:
+        self.hits += 1
+        answer = self.answers.pop(0) if self.answers else 200
+        if isinstance(answer, float):
+            await asyncio.sleep(answer)
+            answer = 200
+        if isinstance(answer, tuple):
+            status, headers = answer
+        else:
+            status, headers = answer, {}
+        if status == 200:
+            return web.Response(text=PAGE, content_type="text/html")
+        return web.Response(status=status, headers=headers)
+
+
+@asynccontextmanager
+async def serve(answers: list) -> AsyncIterator[tuple[FakeServer, str]]:
+    server = FakeServer(answers)
+    app = web.Application()
+    app.router.add_get("/product", server.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield server, f"http://127.0.0.1:{port}/product"
+    finally:
+        await runner.cleanup()
+
+
+async def fetch(url: str, timeout: float = 5) -> Page:
+    async with ClientSession(timeout=ClientTimeout(total=timeout)) as session:
+        return await request(url, lambda: fetch_page(session, url, stream=False))
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    """Short backoff and fresh host limits for each test"""
+
+    monkeypatch.setattr(http, "FETCH_RETRIES", 3)
+    monkeypatch.setattr(http, "FETCH_RETRY_BASE_DELAY", 0.01)
+    monkeypatch.setattr(http, "FETCH_RETRY_MAX_DELAY", 2)
+    monkeypatch.setattr(http, "limiter", None)
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retry_after_is_respected(status):
+    async def main() -> None:
+        async with serve([(status, {"Retry-After": "1"})]) as (server, url):
+            started = time.monotonic()
+            page = await fetch(url)
+            elapsed = time.monotonic() - started
+        assert page.text == PAGE
+        assert server.hits == 2
+        assert elapsed >= 1
+
+    asyncio.run(main())
+
+
+def test_retry_after_is_capped(monkeypatch):
+    monkeypatch.setattr(http, "FETCH_RETRY_MAX_DELAY", 0.1)
+
+    async def main() -> None:
+        async with serve([(503, {"Retry-After": "3600"})]) as (server, url):
+            started = time.monotonic()
+            await fetch(url)
+            elapsed = time.monotonic() - started
+        assert server.hits == 2
+        assert elapsed < 1
+
+    asyncio.run(main())
+
+
+def test_errors_are_raised_after_retries():
+    async def main() -> None:
+        async with serve([500] * 10) as (server, url):
+            with pytest.raises(RetryableError) as error:
+                await fetch(url)
+        assert error.value.status == 500
+        assert server.hits == http.FETCH_RETRIES + 1
+
+    asyncio.run(main())
+
+
+def test_retries_can_be_skipped():
+    async def main() -> None:
+        async with serve([503]) as (server, url):
+            async with ClientSession() as session:
+                with pytest.raises(RetryableError):
+                    await request(url, lambda: fetch_page(session, url, stream=False), retries=0)
+        assert server.hits == 1
+
+    asyncio.run(main())
+
+
+def test_timeouts_are_retried():
+    async def main() -> None:
+        async with serve([0.5, 0.5]) as (server, url):
+            page = await fetch(url, timeout=0.2)
+        assert page.text == PAGE
+        assert server.hits == 3
+
+        async with serve([0.5] * 10) as (server, url):
+            with pytest.raises(asyncio.TimeoutError):
+                await fetch(url, timeout=0.2)
+        assert server.hits == http.FETCH_RETRIES + 1
+
+    asyncio.run(main())
+
+
+def test_backoff_bounds():
+    for attempt in range(10):
+        bound = min(
+            http.FETCH_RETRY_MAX_DELAY, http.FETCH_RETRY_BASE_DELAY * 2**attempt
+        )
+        delays = [get_retry_delay(attempt) for _ in range(100)]
+        assert all(0 <= delay <= bound for delay in delays)
+    assert get_retry_delay(0, retry_after=1.5) == 1.5
+    assert get_retry_delay(0, retry_after=3600) == http.FETCH_RETRY_MAX_DELAY
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker(threshold=2, cooldown=0.1)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+
+    time.sleep(0.1)
+    assert breaker.state == "half_open"
+    # One probe goes, the rest wait for its result
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.1)
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow_request()
+    assert breaker.allow_request()
+
+
+def test_breaker_counts_requests_not_attempts():
+    async def main() -> None:
+        async with serve([503] * 3) as (server, url):
+            # A flaky page recovers within the retries and doesn't count
+            await fetch(url)
+            breaker = http.get_limiter().breaker(url)
+            assert breaker.failures == 0
+
+        async with serve([503] * 100) as (server, url):
+            breaker = http.get_limiter().breaker(url)
+            breaker.threshold = 2
+            for failures in (1, 2):
+                with pytest.raises(RetryableError):
+                    await fetch(url)
+                assert breaker.failures == failures
+            assert breaker.state == "open"
+
+            hits = server.hits
+            with pytest.raises(HostUnavailable):
+                await fetch(url)
+            assert server.hits == hits
+
+    asyncio.run(main())
+
+
+def test_breaker_probe_closes_the_circuit(monkeypatch):
+    monkeypatch.setattr(http, "FETCH_RETRIES", 0)
+
+    async def main() -> None:
+        async with serve([503]) as (server, url):
+            breaker = http.get_limiter().breaker(url)
+            breaker.threshold = 1
+            breaker.cooldown = 0.1
+            with pytest.raises(RetryableError):
+                await fetch(url)
+            with pytest.raises(HostUnavailable):
+                await fetch(url)
+
+            await asyncio.sleep(0.1)
+            page = await fetch(url)
+            assert page.text == PAGE
+            assert breaker.state == "closed"
+
+    asyncio.run(main())
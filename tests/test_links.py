@@ -0,0 +1,23 @@
+from source.bot.products.services import canonicalize_link
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "link",
+    [
+        "https://catalog.onliner.by/mobile/apple/iphone15",
+        "https://catalog.onliner.by/mobile/apple/iphone15/",
+        "https://CATALOG.Onliner.by/mobile/apple/iphone15",
+        "https://catalog.onliner.by/mobile/apple/iphone15?utm_source=share",
+        "https://catalog.onliner.by/mobile/apple/iphone15#reviews",
+        "  https://catalog.onliner.by/mobile/apple/iphone15/?region=minsk#offers\n",
+        "HTTPS://catalog.onliner.by/mobile/apple/iphone15",
+    ],
+)
+def test_spellings_of_a_link_are_one_link(link):
+    assert canonicalize_link(link) == "https://catalog.onliner.by/mobile/apple/iphone15"
+
+
+def test_path_case_is_kept():
+    assert canonicalize_link("https://catalog.onliner.by/Mobile/Apple") == "https://catalog.onliner.by/Mobile/Apple"
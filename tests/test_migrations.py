@@ -0,0 +1,143 @@
+import asyncio
+from datetime import datetime
+
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import DateTime, inspect, text
+from sqlalchemy.engine import Connection
+
+from source.database import engine as db
+from source.database.models import Base
+from source.database.settings import ALEMBIC_CONFIG
+
+
+def get_drift(connection: Connection) -> list:
+    context = MigrationContext.configure(connection, opts={"compare_type": True})
+    return compare_metadata(context, Base.metadata)
+
+
+def get_revision(connection: Connection) -> str | None:
+    return MigrationContext.configure(connection).get_current_revision()
+
+
+def upgrade(connection: Connection, revision: str) -> None:
+    config = Config(ALEMBIC_CONFIG)
+    config.attributes["connection"] = connection
+    command.upgrade(config, revision)
+
+
+def create_legacy_schema(connection: Connection) -> None:
+    """The schema of the former "create_all" call, without the Alembic version"""
+
+    upgrade(connection, db.INITIAL_REVISION)
+    connection.execute(text("DROP TABLE alembic_version"))
+
+
+async def inspect_schema() -> tuple[str | None, list]:
+    engine = await db.get_engine()
+    async with engine.connect() as conn:
+        revision = await conn.run_sync(get_revision)
+        drift = await conn.run_sync(get_drift)
+    return revision, drift
+
+
+def get_head() -> str:
+    return ScriptDirectory.from_config(Config(ALEMBIC_CONFIG)).get_current_head()
+
+
+def test_migrate_fresh_database(database):
+    asyncio.run(db.migrate())
+
+    revision, drift = asyncio.run(inspect_schema())
+    assert revision == get_head()
+    assert drift == []
+
+
+def test_migrate_legacy_database(database):
+    async def prepare() -> list[str]:
+        engine = await db.get_engine()
+        async with engine.begin() as conn:
+            await conn.run_sync(create_legacy_schema)
+        async with engine.connect() as conn:
+            return await conn.run_sync(lambda sync: inspect(sync).get_table_names())
+
+    tables = asyncio.run(prepare())
+    assert "users" in tables
+    assert "alembic_version" not in tables
+
+    asyncio.run(db.migrate())
+
+    revision, drift = asyncio.run(inspect_schema())
+    assert revision == get_head()
+    assert drift == []
+
+
+def test_migrate_twice(database):
+    asyncio.run(db.migrate())
+    asyncio.run(db.migrate())
+
+    revision, drift = asyncio.run(inspect_schema())
+    assert revision == get_head()
+    assert drift == []
+
+
+def test_merge_duplicate_products(database):
+    """Revision 0006 merges spellings of a link with subscribers and price history"""
+
+    days = [datetime(2026, 1, day) for day in range(1, 4)]
+
+    def seed(connection: Connection) -> None:
+        upgrade(connection, "0005")
+        connection.execute(
+            text("INSERT INTO users (id, username, is_admin) VALUES (:id, :username, false)"),
+            [{"id": 1, "username": "first"}, {"id": 2, "username": "second"}],
+        )
+        connection.execute(
+            text(
+                "INSERT INTO products (id, product_link, current_price, previous_price, updated_at) "
+                "VALUES (:id, :link, 0, 0, :updated_at)"
+            ),
+            [
+                {"id": 1, "link": "https://catalog.onliner.by/phone", "updated_at": days[0]},
+                # Refreshed last, it's kept
+                {"id": 2, "link": "https://CATALOG.onliner.by/phone/?utm=1", "updated_at": days[1]},
+                {"id": 3, "link": "https://catalog.onliner.by/tv#reviews", "updated_at": None},
+            ],
+        )
+        connection.execute(
+            text("INSERT INTO users_products (users_id, products_id) VALUES (:user, :product)"),
+            [{"user": 1, "product": 1}, {"user": 2, "product": 1}, {"user": 2, "product": 2}],
+        )
+        connection.execute(
+            text("INSERT INTO price_points (product_id, ts, price) VALUES (:product, :ts, :price)"),
+            [
+                {"product": 1, "ts": days[0], "price": 10},
+                {"product": 1, "ts": days[1], "price": 11},
+                {"product": 2, "ts": days[1], "price": 11},
+                {"product": 2, "ts": days[2], "price": 12},
+            ],
+        )
+
+    def select(connection: Connection) -> tuple[set, ...]:
+        products = connection.execute(text("SELECT id, product_link FROM products"))
+        subscriptions = connection.execute(text("SELECT users_id, products_id FROM users_products"))
+        points = connection.execute(
+            text("SELECT product_id, ts, price FROM price_points").columns(ts=DateTime())
+        )
+        return tuple({tuple(row) for row in rows} for rows in (products, subscriptions, points))
+
+    async def main() -> tuple[set, ...]:
+        engine = await db.get_engine()
+        async with engine.begin() as conn:
+            await conn.run_sync(seed)
+        await db.migrate()
+        async with engine.connect() as conn:
+            return await conn.run_sync(select)
+
+    products, subscriptions, points = asyncio.run(main())
+    assert products == {(2, "https://catalog.onliner.by/phone"), (3, "https://catalog.onliner.by/tv")}
+    assert subscriptions == {(1, 2), (2, 2)}
+    assert points == {(2, days[0], 10), (2, days[1], 11), (2, days[2], 12)}